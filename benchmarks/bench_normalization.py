@@ -0,0 +1,86 @@
+"""
+Compares the row-wise and pandas normalization paths of process_csv on
+synthetic price_verification rows and checks that they agree.
+
+    python benchmarks/bench_normalization.py --rows 200000
+"""
+import argparse
+import csv
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from data_handler import read_csv, process_product_row
+from batch_normalizer import normalize_file
+
+URLS = [
+    "https://mercado.carrefour.com.br/",
+    "https://superveneza.instabuy.com.br/",
+    "https://www.paodeacucar.com/",
+    "https://vitaliaparksul.instabuy.com.br/",
+    "https://105sudoeste.bigboxdelivery.com.br/",
+]
+BRANDS = ["Stella Artois", "Becks", "Corona Extra", "Heineken"]
+VOLUMES = ["350ml", "330ml", "269ml", "600ml", "5l", "275 ml", "473ml", ""]
+PACKAGES = ["lata", "garrafa", "long neck", "ln", "barril", "keg", ""]
+PACKS = ["", "", "6 unidades", "12 un", "pack 8", "caixa com 24 und", "15 pack"]
+
+def price_text(value):
+    return f"R$ {value:.2f}".replace(".", ",")
+
+def write_synthetic_csv(path, rows, seed=42):
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="latin-1") as file:
+        writer = csv.writer(file)
+        writer.writerow(["url", "item", "product_description", "product_price", "product_discount_price"])
+        for _ in range(rows):
+            brand = rng.choice(BRANDS)
+            description = " ".join(filter(None, [
+                "cerveja", brand.lower(), rng.choice(PACKAGES), rng.choice(VOLUMES), rng.choice(PACKS)
+            ]))
+            price = rng.uniform(2.5, 150)
+            roll = rng.random()
+            if roll < 0.05:
+                promo = ""
+            elif roll < 0.08:
+                promo = "indisponível"
+            else:
+                promo = price_text(price * rng.uniform(0.7, 1.0))
+            writer.writerow([rng.choice(URLS), brand.split()[0], description, price_text(price), promo])
+
+def normalized(row):
+    return {key: value for key, value in row.items() if value is not None}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "price_verification_bench.csv")
+        write_synthetic_csv(path, args.rows)
+
+        start = time.perf_counter()
+        row_wise = [process_product_row(row) for row in read_csv(path)]
+        row_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = list(normalize_file(path))
+        batch_seconds = time.perf_counter() - start
+
+    mismatches = sum(normalized(a) != normalized(b) for a, b in zip(row_wise, batch))
+    print(f"rows:       {args.rows}")
+    print(f"row-wise:   {row_seconds:.2f}s ({args.rows / row_seconds:,.0f} rows/s)")
+    print(f"pandas:     {batch_seconds:.2f}s ({args.rows / batch_seconds:,.0f} rows/s)")
+    print(f"speedup:    {row_seconds / batch_seconds:.1f}x")
+    print(f"mismatches: {mismatches}")
+    return 1 if mismatches or len(row_wise) != len(batch) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
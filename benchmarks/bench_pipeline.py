@@ -0,0 +1,283 @@
+"""
+Benchmarks the scrape-and-normalize pipeline offline: serves the synthetic
+store pages in benchmarks/synthetic_fixtures from a local HTTP server, answers
+AgentQL queries deterministically from each fixture's fields.json, and times
+SiteLogic setup, search_item and save_json_as_csv per item, followed by
+process_csv throughput. Results are written to JSON so runs on different
+commits can be compared.
+
+The fixtures are small hand-written pages shaped like each store's results
+page, not captures of the live sites, so they measure the crawl code paths
+rather than real page weight or rendering time.
+
+    python benchmarks/bench_pipeline.py --rounds 3 --rows 100000
+    python benchmarks/bench_pipeline.py --baseline benchmarks/results/pipeline-<commit>.json
+    python benchmarks/bench_pipeline.py --render full   # without the resource-blocking profile
+
+To benchmark against real pages instead, save page.content() of a store's home
+and search pages as home.html and search.html in a folder named after its host
+and set the selectors in fields.json.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from fnmatch import fnmatch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+
+import session_manager
+from browser_pool import BrowserPool
+from session_manager import SessionManager
+from site_logic import SiteLogic
+from site_adapters import registry, SITES_CONFIG
+from selector_cache import SelectorCache
+from session_store import SessionStore
+from data_handler import save_json_as_csv, close_csv_writers, process_csv
+from fake_agentql import FakeAgentQL
+from bench_normalization import write_synthetic_csv
+from tracing import tracer
+from render_profile import RenderProfile
+
+FIXTURES = os.path.join(BENCH_DIR, "synthetic_fixtures")
+RESULTS = os.path.join(BENCH_DIR, "results")
+ITEMS = ["Stella", "Becks", "Corona", "Heineken"]
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """
+    Serves home.html at / and search.html for any other page, after the
+    configured latency.
+    """
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/favicon.ico":
+            self.send_error(404)
+            return
+        time.sleep(self.server.latency)
+        with open(os.path.join(self.server.folder, "home.html" if path == "/" else "search.html"), "rb") as file:
+            body = file.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(folder, latency):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    server.folder = folder
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, name=f"fixture-{os.path.basename(folder)}", daemon=True).start()
+    return server
+
+def register_store(host, port):
+    """
+    Gives the local server the adapter configured for the real store host and
+    returns the URL to crawl.
+    """
+    with open(SITES_CONFIG, "r", encoding="utf-8") as file:
+        sites = json.load(file)["sites"]
+    overrides = next((config for pattern, config in sites.items() if fnmatch(host, pattern)), {})
+    local = f"127.0.0.1:{port}"
+    registry.register(local, overrides)
+    return f"http://{local}/"
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def summarize(samples):
+    latencies = [sample["latency_s"] for sample in samples]
+    return {
+        "items": len(samples),
+        "errors": sum(1 for sample in samples if sample["error"]),
+        "latency_p50_s": percentile(latencies, 0.5),
+        "latency_p95_s": percentile(latencies, 0.95),
+        "queries_per_item": statistics.mean(sample["queries"] for sample in samples) if samples else None,
+        "save_ms_mean": statistics.mean(sample["save_ms"] for sample in samples) if samples else None,
+    }
+
+def run_store(pool, url, items, rounds, fake, selector_cache, session_store, csv_file):
+    """
+    Runs setup and every item's search on one store. Round 1 starts with an
+    empty selector cache; later rounds show the warm path.
+    """
+    manager = SessionManager(url, pool)
+    try:
+        site_logic = SiteLogic(manager.session, url, selector_cache=selector_cache)
+        start = time.perf_counter()
+        site_logic.setup(session_store)
+        setup_s = time.perf_counter() - start
+        samples = []
+        for round_number in range(1, rounds + 1):
+            for item in items:
+                queries = fake.queries.count
+                error = None
+                products = 0
+                save_ms = 0.0
+                start = time.perf_counter()
+                try:
+                    search_results = site_logic.search_item(item)
+                    latency_s = time.perf_counter() - start
+                    products = len(search_results["results"]["products"])
+                    save_start = time.perf_counter()
+                    save_json_as_csv(search_results, csv_file, url, item)
+                    save_ms = (time.perf_counter() - save_start) * 1000
+                except Exception as e:
+                    latency_s = time.perf_counter() - start
+                    error = str(e)
+                samples.append({
+                    "round": round_number,
+                    "item": item,
+                    "latency_s": latency_s,
+                    "queries": fake.queries.count - queries,
+                    "products": products,
+                    "save_ms": save_ms,
+                    "error": error,
+                })
+        return setup_s, samples
+    finally:
+        manager.stop()
+
+def bench_crawl(folder, rounds, latency, render_profile=None):
+    hosts = sorted(name for name in os.listdir(FIXTURES) if os.path.isdir(os.path.join(FIXTURES, name)))
+    servers, fields, urls = [], {}, {}
+    for host in hosts:
+        server = start_server(os.path.join(FIXTURES, host), latency)
+        servers.append(server)
+        urls[host] = register_store(host, server.server_address[1])
+        with open(os.path.join(FIXTURES, host, "fields.json"), "r", encoding="utf-8") as file:
+            fields[urlparse(urls[host]).netloc] = json.load(file)
+
+    fake = FakeAgentQL(lambda page_url: fields[urlparse(page_url).netloc])
+    session_manager.agentql = fake
+    selector_cache = SelectorCache(os.path.join(folder, "selector_cache.json"))
+    session_store = SessionStore(os.path.join(folder, "sessions"))
+    csv_file = os.path.join(folder, "price_verification_bench.csv")
+
+    stores = {}
+    try:
+        with BrowserPool(size=1, render_profile=render_profile) as pool:
+            for host in hosts:
+                setup_s, samples = pool.submit(run_store, pool, urls[host], ITEMS, rounds, fake,
+                                               selector_cache, session_store, csv_file).result()
+                stores[host] = {
+                    "setup_s": setup_s,
+                    "cold": summarize([s for s in samples if s["round"] == 1]),
+                    "warm": summarize([s for s in samples if s["round"] > 1]),
+                    "samples": samples,
+                }
+                print(f"{host}: setup {setup_s:.2f}s, cold p50 {stores[host]['cold']['latency_p50_s']:.3f}s "
+                      f"({stores[host]['cold']['queries_per_item']:.1f} queries/item)")
+    finally:
+        for server in servers:
+            server.shutdown()
+        close_csv_writers()
+    return stores
+
+def bench_normalization(folder, rows, engines):
+    path = os.path.join(folder, "price_verification_synthetic.csv")
+    write_synthetic_csv(path, rows)
+    results = {"rows": rows}
+    for engine in engines:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            process_csv(path, engine=engine)
+        seconds = time.perf_counter() - start
+        results[engine] = {"seconds": seconds, "rows_per_s": rows / seconds}
+        print(f"process_csv ({engine}): {rows / seconds:,.0f} rows/s")
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def key_metrics(results):
+    metrics = {}
+    for host, store in results["stores"].items():
+        for phase in ("cold", "warm"):
+            if store[phase]["items"]:
+                metrics[f"{host} {phase} p50 latency (s)"] = store[phase]["latency_p50_s"]
+                metrics[f"{host} {phase} queries/item"] = store[phase]["queries_per_item"]
+    for engine, value in results["normalization"].items():
+        if isinstance(value, dict):
+            metrics[f"process_csv {engine} rows/s"] = value["rows_per_s"]
+    return metrics
+
+def compare(results, baseline_file):
+    with open(baseline_file, "r", encoding="utf-8") as file:
+        baseline = key_metrics(json.load(file))
+    print(f"\nChange against {baseline_file}:")
+    for name, value in key_metrics(results).items():
+        previous = baseline.get(name)
+        if previous:
+            print(f"  {name}: {previous:.3f} -> {value:.3f} ({(value - previous) / previous:+.1%})")
+
+def engines_available():
+    engines = ["rows"]
+    try:
+        import pandas  # noqa: F401
+        engines.append("pandas")
+    except ImportError:
+        pass
+    return engines
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=3, help="searches per item; round 1 is the cold run")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated server latency per page")
+    parser.add_argument("--rows", type=int, default=100_000, help="synthetic rows for process_csv throughput")
+    parser.add_argument("--render", choices=["light", "full"], default="light",
+                        help="crawl with or without the resource-blocking render profile")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/pipeline-<commit>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as folder:
+        render_profile = RenderProfile() if args.render == "light" else None
+        stores = bench_crawl(folder, args.rounds, args.latency_ms / 1000, render_profile)
+        normalization = bench_normalization(folder, args.rows, engines_available())
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "settings": {"rounds": args.rounds, "latency_ms": args.latency_ms, "items": ITEMS, "render": args.render},
+        "stores": stores,
+        "stages": tracer.stage_summary(),
+        "render": render_profile.summary() if render_profile else None,
+        "normalization": normalization,
+    }
+    output = args.output or os.path.join(RESULTS, f"pipeline-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Wrote {output}")
+    if args.baseline:
+        compare(results, args.baseline)
+    return 1 if any(store["cold"]["errors"] or store["warm"]["errors"] for store in stores.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
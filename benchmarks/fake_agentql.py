@@ -0,0 +1,113 @@
+"""
+Deterministic stand-in for the AgentQL query layer, for benchmarks run against
+synthetic store fixtures. Each fixture declares the CSS selector behind every query field
+in fields.json, so query_elements answers with ordinary Playwright locators
+instead of calling the AgentQL service.
+"""
+import re
+import threading
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z_]\w*(?:\[\])?|[{}]")
+
+def parse_query(query):
+    """
+    Parses an AgentQL query into {field: None | {subfields}}. List fields keep
+    their "[]" suffix.
+    """
+    tokens = TOKEN_PATTERN.findall(query)
+
+    def block(position):
+        fields = {}
+        position += 1
+        while tokens[position] != "}":
+            name = tokens[position]
+            position += 1
+            if tokens[position] == "{":
+                fields[name], position = block(position)
+            else:
+                fields[name] = None
+        return fields, position + 1
+
+    return block(0)[0]
+
+class FakeResponse:
+    """
+    Attribute access to the resolved locators, like an AgentQL response.
+    """
+    def __init__(self, values):
+        self._values = values
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def to_data(self):
+        return {name: data_of(value) for name, value in self._values.items()}
+
+def data_of(value):
+    if value is None:
+        return None
+    if isinstance(value, FakeResponse):
+        return value.to_data()
+    if isinstance(value, list):
+        return [data_of(item) for item in value]
+    return value.inner_text().strip()
+
+class QueryCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def increment(self):
+        with self._lock:
+            self.count += 1
+
+class FakePage:
+    """
+    Wraps a Playwright page the way agentql.wrap does, answering query_elements
+    from the fixture selectors of the store the page is on.
+    """
+    def __init__(self, page, fields_for, counter):
+        self._page = page
+        self._fields_for = fields_for
+        self._counter = counter
+
+    def __getattr__(self, name):
+        return getattr(self._page, name)
+
+    def query_elements(self, query):
+        self._counter.increment()
+        fields = self._fields_for(self._page.url)
+        return self._resolve(self._page, parse_query(query), "", fields)
+
+    def _resolve(self, scope, tree, prefix, fields):
+        values = {}
+        for name, subtree in tree.items():
+            is_list = name.endswith("[]")
+            name = name[:-2] if is_list else name
+            path = f"{prefix}{name}"
+            selector = fields.get(path)
+            if subtree is not None and selector is None:
+                values[name] = self._resolve(scope, subtree, f"{path}.", fields)
+            elif selector is None:
+                values[name] = None
+            elif is_list:
+                values[name] = [self._resolve(element, subtree, f"{path}.", fields) if subtree else element
+                                for element in scope.locator(selector).all()]
+            else:
+                locator = scope.locator(selector).first
+                values[name] = locator if locator.count() else None
+        return FakeResponse(values)
+
+class FakeAgentQL:
+    """
+    Drop-in for the agentql module as session_manager uses it.
+    """
+    def __init__(self, fields_for):
+        self.fields_for = fields_for
+        self.queries = QueryCounter()
+
+    def wrap(self, page):
+        return FakePage(page, self.fields_for, self.queries)
@@ -0,0 +1,276 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode, urljoin
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# Normalized (lowercase, no "_" or "-") JSON keys recognised as each product
+# field, in order of preference.
+FIELD_KEYS = {
+    "product_description": ["name", "productname", "title", "displayname", "description", "nome", "descricao"],
+    "product_price": ["price", "regularprice", "listprice", "originalprice", "unitprice", "preco"],
+    "product_discount_price": ["promoprice", "promotionalprice", "saleprice", "discountprice", "specialprice",
+                               "offerprice", "bestprice", "precopromocional"],
+    "product_link": ["url", "link", "permalink", "href", "slug"],
+}
+# Headers of the captured request that are not replayed on direct calls.
+SKIPPED_HEADERS = {"cookie", "host", "content-length", "accept-encoding", "connection"}
+
+def normalized(key):
+    return key.lower().replace("_", "").replace("-", "")
+
+def flatten(value, prefix="", depth=2):
+    """
+    Flattens nested dicts into {dotted key: scalar}, down to depth levels.
+    """
+    flat = {}
+    for key, item in value.items():
+        path = f"{prefix}{key}"
+        if isinstance(item, dict):
+            if depth > 0:
+                flat.update(flatten(item, f"{path}.", depth - 1))
+        elif not isinstance(item, list):
+            flat[path] = item
+    return flat
+
+def detect_fields(sample):
+    """
+    Returns {product field: dotted key} for a list of product objects, or None
+    unless a description and a price are found in most of them.
+    """
+    flat = [flatten(product) for product in sample]
+    keys = {}
+    for product in flat:
+        for key in product:
+            keys.setdefault(key, None)
+    fields = {}
+    for field, candidates in FIELD_KEYS.items():
+        for candidate in candidates:
+            matches = sorted((key for key in keys if normalized(key.rsplit(".", 1)[-1]) == candidate),
+                             key=lambda key: key.count("."))
+            matches = [key for key in matches if key not in fields.values()]
+            if matches:
+                fields[field] = matches[0]
+                break
+    if "product_description" not in fields or "product_price" not in fields:
+        return None
+    complete = sum(1 for product in flat
+                   if isinstance(product.get(fields["product_description"]), str)
+                   and product.get(fields["product_price"]) not in (None, ""))
+    return fields if complete >= len(flat) / 2 else None
+
+def product_lists(value, path="", depth=6):
+    """
+    Yields (dotted path, list) for every list of objects in a JSON payload.
+    """
+    if isinstance(value, list):
+        if value and all(isinstance(item, dict) for item in value):
+            yield path, value
+    elif isinstance(value, dict) and depth > 0:
+        for key, item in value.items():
+            yield from product_lists(item, f"{path}.{key}" if path else key, depth - 1)
+
+def find_products(payload, item=None):
+    """
+    Finds the product list in a search API payload. Returns (path, fields), or
+    None when nothing in it looks like products. Lists naming item win over
+    longer ones that don't.
+    """
+    best = None
+    for path, products in product_lists(payload):
+        fields = detect_fields(products[:20])
+        if fields is None:
+            continue
+        names = [str(flatten(p).get(fields["product_description"]) or "").lower() for p in products]
+        mentions = sum(1 for name in names if item and item.lower() in name)
+        score = (mentions > 0, len(products))
+        if best is None or score > best[0]:
+            best = (score, path, fields)
+    return best[1:] if best else None
+
+def resolve_path(payload, path):
+    for key in path.split(".") if path else []:
+        if not isinstance(payload, dict):
+            return None
+        payload = payload.get(key)
+    return payload
+
+def format_price(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"{value:.2f}"
+    return value
+
+def map_products(payload, path, fields, base_url):
+    """
+    Maps the product list at path into the products[] shape save_json_as_csv
+    expects. Returns None when the payload no longer has a list there.
+    """
+    products = resolve_path(payload, path)
+    if not isinstance(products, list):
+        return None
+    mapped = []
+    for product in products:
+        if not isinstance(product, dict):
+            continue
+        flat = flatten(product)
+        link = flat.get(fields.get("product_link"))
+        mapped.append({
+            "product_link": urljoin(base_url, str(link)) if link else None,
+            "product_description": flat.get(fields["product_description"]),
+            "product_price": format_price(flat.get(fields["product_price"])),
+            "product_discount_price": format_price(flat.get(fields.get("product_discount_price"))),
+        })
+    return mapped
+
+def endpoint_template(response_url, item):
+    """
+    Returns the endpoint behind a GET search response, with the parameter that
+    carried item marked, or None when item is not a query parameter.
+    """
+    parsed = urlparse(response_url)
+    params = [[name, value] for name, value in parse_qsl(parsed.query, keep_blank_values=True)]
+    query_param = next((name for name, value in params if item and value.lower() == item.lower()), None)
+    if query_param is None:
+        return None
+    return {
+        "url": urlunparse(parsed._replace(query="", fragment="")),
+        "params": [[name, "" if name == query_param else value] for name, value in params],
+        "query_param": query_param,
+    }
+
+def endpoint_url(endpoint, item):
+    params = [(name, item if name == endpoint["query_param"] else value) for name, value in endpoint["params"]]
+    return f"{endpoint['url']}?{urlencode(params)}"
+
+def replay_headers(headers):
+    return {name: value for name, value in headers.items() if name.lower() not in SKIPPED_HEADERS and not name.startswith(":")}
+
+class ApiEndpoints:
+    """
+    Search endpoints learned from the JSON responses captured on each site's
+    results pages, keyed by site host and persisted to a JSON file between
+    runs. Request headers are kept in memory only, since they may carry
+    session tokens.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._headers = {}
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                self.entries = json.load(file)
+            logger.info("Loaded %d API endpoints from %s", len(self.entries), path)
+
+    def lookup(self, url):
+        """
+        Returns (endpoint, headers) for the site at url; endpoint is None until one is learned.
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            return self.entries.get(host), self._headers.get(host, {})
+
+    def learn(self, url, response_url, method, headers, path, fields, item):
+        """
+        Records the endpoint behind a captured search response. Only GET
+        endpoints carrying item in a query parameter can be called directly.
+        """
+        host = urlparse(url).netloc
+        template = endpoint_template(response_url, item) if method == "GET" else None
+        if template is None:
+            logger.debug("Search API at %s can only be captured, not called directly", response_url)
+            return
+        entry = {**template, "products": path, "fields": fields}
+        with self._lock:
+            self._headers[host] = replay_headers(headers)
+            known = self.entries.get(host)
+            if known is not None and {**known, "learned_at": None} == {**entry, "learned_at": None}:
+                return
+            entry["learned_at"] = datetime.now().isoformat(timespec="seconds")
+            self.entries[host] = entry
+            self._save()
+        logger.info("Learned search API for %s: %s (%s)", host, template["url"], path or "top level")
+
+    def invalidate(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            self._headers.pop(host, None)
+            if self.entries.pop(host, None) is not None:
+                logger.info("Invalidated search API for %s", host)
+                self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file, indent=2)
+        os.replace(tmp_path, self.path)
+
+class ApiClient:
+    """
+    Pooled HTTP clients for direct search API calls, shared by every site so
+    connections are kept alive between items.
+    """
+    def __init__(self, timeout=10.0, max_connections=20):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_client = None
+
+    @property
+    def available(self):
+        return httpx is not None
+
+    def get_json(self, url, headers=None, cookies=None):
+        """
+        Returns (status, payload) of a GET. The payload is None unless the answer was 200 JSON.
+        """
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(timeout=self.timeout, follow_redirects=True,
+                                            limits=httpx.Limits(max_connections=self.max_connections))
+        response = self._client.get(url, headers=self._headers(headers, cookies))
+        return response.status_code, self._payload(response)
+
+    async def get_json_async(self, url, headers=None, cookies=None):
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(timeout=self.timeout, follow_redirects=True,
+                                                   limits=httpx.Limits(max_connections=self.max_connections))
+        response = await self._async_client.get(url, headers=self._headers(headers, cookies))
+        return response.status_code, self._payload(response)
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def _headers(self, headers, cookies):
+        headers = dict(headers or {})
+        headers.setdefault("accept", "application/json")
+        if cookies:
+            headers["cookie"] = "; ".join(f"{cookie['name']}={cookie['value']}" for cookie in cookies)
+        return headers
+
+    def _payload(self, response):
+        if response.status_code != 200 or "json" not in response.headers.get("content-type", ""):
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+api_client = ApiClient()
@@ -0,0 +1,224 @@
+import argparse
+import csv
+import glob
+import io
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from data_handler import (process_product_row, processed_fieldnames, find_lowest_price_per_type,
+                          print_lowest_prices, read_csv)
+from columnar_sink import run_timestamp_for
+from logger import setup_logging, stop_logging, run_counters
+from price_history import PriceHistory
+from top_offers import TopOffers, write_top_offers
+
+logger = logging.getLogger(__name__)
+
+def chunk_offsets(input_file, chunk_bytes):
+    """
+    Splits input_file into (start, end) byte ranges of about chunk_bytes that
+    begin and end on CSV row boundaries. The first range starts after the header.
+    A line with an odd number of quotes opens or closes a quoted field, so
+    descriptions with embedded newlines never straddle two ranges.
+    """
+    offsets = []
+    with open(input_file, "rb") as file:
+        header = file.readline()
+        start = position = len(header)
+        in_quotes = False
+        for line in file:
+            position += len(line)
+            if line.count(b'"') % 2:
+                in_quotes = not in_quotes
+            if not in_quotes and position - start >= chunk_bytes:
+                offsets.append((start, position))
+                start = position
+        if position > start:
+            offsets.append((start, position))
+    return offsets
+
+def process_chunk(input_file, start, end, fieldnames, part_file, top_k):
+    """
+    Worker: normalizes the rows in one byte range of input_file into part_file
+    (no header) and returns the row count, its lowest prices, its top offers
+    and its counters.
+    """
+    run_counters.reset()
+    with open(input_file, "rb") as file:
+        file.seek(start)
+        text = file.read(end - start).decode("latin-1")
+    header = fieldnames[:fieldnames.index("volume")]
+    rows = (process_product_row(row) for row in csv.DictReader(io.StringIO(text, newline=""), fieldnames=header))
+    top_offers = TopOffers(top_k)
+    count = 0
+    lowest_prices = {}
+    with open(part_file, mode="w", newline="", encoding="utf-8") as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+        def written(rows):
+            nonlocal count
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+                yield row
+        lowest_prices = dict(find_lowest_price_per_type(top_offers.track(written(rows))))
+    return count, lowest_prices, top_offers.result(), run_counters.summary()
+
+def merge_lowest_prices(parts):
+    """
+    Combines per-chunk lowest prices in chunk order, the same way
+    find_lowest_price_per_type combines rows.
+    """
+    merged = {}
+    for lowest_prices in parts:
+        for product_type, info in lowest_prices.items():
+            if info['product'] is None:
+                merged.setdefault(product_type, info)
+                continue
+            current = merged.get(product_type)
+            if current is None or current['product'] is None or info['price'] < current['price']:
+                merged[product_type] = info
+            elif info['price'] == current['price'] and info['product']['url'] != current['product']['url']:
+                current['product'] = {**current['product'],
+                                      'url': current['product']['url'] + ', ' + info['product']['url']}
+    return merged
+
+def submit_file(executor, input_file, chunk_bytes, top_k=5):
+    """
+    Queues the chunks of one file on the pool without waiting for them.
+    Returns the pending job for collect_file.
+    """
+    fieldnames = processed_fieldnames(input_file)
+    output_file = f"{input_file}_processed.csv"
+    offsets = chunk_offsets(input_file, chunk_bytes)
+    part_files = [f"{output_file}.part{index}" for index in range(len(offsets))]
+    futures = [executor.submit(process_chunk, input_file, start, end, fieldnames, part_file, top_k)
+               for (start, end), part_file in zip(offsets, part_files)]
+    return {"input_file": input_file, "output_file": output_file, "fieldnames": fieldnames,
+            "part_files": part_files, "futures": futures, "top_k": top_k}
+
+def collect_file(job):
+    """
+    Waits for a submitted file's chunks and writes <input_file>_processed.csv
+    by concatenating their outputs in order, plus its top offers report.
+    Returns (rows, lowest_prices).
+    """
+    input_file = job["input_file"]
+    rows = 0
+    parts = []
+    top_offers = TopOffers(job["top_k"])
+    try:
+        with open(job["output_file"], mode="w", newline="", encoding="utf-8") as outfile:
+            csv.DictWriter(outfile, fieldnames=job["fieldnames"]).writeheader()
+            for future, part_file in zip(job["futures"], job["part_files"]):
+                count, lowest_prices, offers, counters = future.result()
+                rows += count
+                parts.append(lowest_prices)
+                top_offers.merge(offers)
+                for name, amount in counters.items():
+                    run_counters.increment(name, amount)
+                with open(part_file, "r", newline="", encoding="utf-8") as part:
+                    shutil.copyfileobj(part, outfile)
+    finally:
+        for future in job["futures"]:
+            future.cancel()
+        for future, part_file in zip(job["futures"], job["part_files"]):
+            if not future.cancelled():
+                # A running chunk may still be writing its part file.
+                try:
+                    future.result()
+                except Exception:
+                    pass
+            if os.path.exists(part_file):
+                os.remove(part_file)
+    write_top_offers(f"{input_file}_top_offers.csv", top_offers.result())
+    logger.info("Backfilled %d rows of %s in %d chunks", rows, input_file, len(job["part_files"]))
+    return rows, merge_lowest_prices(parts)
+
+def backfill_file(executor, input_file, chunk_bytes, top_k=5):
+    """
+    Re-processes one file across the pool. Returns (rows, lowest_prices).
+    """
+    return collect_file(submit_file(executor, input_file, chunk_bytes, top_k))
+
+def record_history(history, input_file):
+    """
+    Records the re-processed file in the price history, reading it back as a stream.
+    """
+    history.record_snapshot(read_csv(f"{input_file}_processed.csv"), run_timestamp_for(input_file))
+
+# Reports written next to each run file, which the run-file glob also matches.
+DERIVED_SUFFIXES = ("_processed.csv", "_top_offers.csv")
+
+def is_run_file(path):
+    return not path.endswith(DERIVED_SUFFIXES)
+
+def input_files(paths):
+    """
+    Returns the raw run files among paths, expanding folders to their
+    price_verification_*.csv files without the derived reports.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(filter(is_run_file, glob.glob(os.path.join(path, "price_verification_*.csv")))))
+        elif is_run_file(path):
+            files.append(path)
+        else:
+            logger.warning("Skipping %s: it is a derived report, not a run file", path)
+    return files
+
+def backfill(paths, workers=None, chunk_bytes=8 * 1024 * 1024, history=None, top_k=5):
+    """
+    Re-processes every raw price_verification_*.csv under paths in parallel and
+    returns (rows, seconds). The chunks of all files are queued up front, so
+    small files that fit in one chunk still keep every worker busy; results
+    are then merged in file and chunk order. The seconds count the
+    normalization only, not the price-history recording.
+    """
+    files = input_files(paths)
+    logger.info("Backfilling %d files with %s workers", len(files), workers or os.cpu_count())
+    total_rows = 0
+    results = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = [submit_file(executor, input_file, chunk_bytes, top_k) for input_file in files]
+        for job in jobs:
+            rows, lowest_prices = collect_file(job)
+            total_rows += rows
+            results.append((job["input_file"], rows, lowest_prices))
+    total_elapsed = time.perf_counter() - started
+    for input_file, rows, lowest_prices in results:
+        print(f"{os.path.basename(input_file)}: {rows:,} rows")
+        if history:
+            record_history(history, input_file)
+        print_lowest_prices(lowest_prices)
+    return total_rows, total_elapsed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Re-process archived price_verification_*.csv files in parallel.")
+    parser.add_argument("paths", nargs="+", help="CSV files or folders containing them")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-mb", type=float, default=8.0, help="shard files into chunks of about this size")
+    parser.add_argument("--history", metavar="DB", help="also record every file in this price-history database")
+    parser.add_argument("--top-k", type=int, default=5, help="cheapest offers to report per item, volume and package")
+    parser.add_argument("--log-file", default="backfill.log")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    setup_logging(args.log_file)
+    history = PriceHistory(args.history) if args.history else None
+    try:
+        rows, elapsed = backfill(args.paths, args.workers, int(args.chunk_mb * 1024 * 1024), history, args.top_k)
+    finally:
+        if history:
+            history.close()
+    print(f"Total: {rows:,} rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:,.0f} rows/s)")
+    logger.info("Backfilled %d rows in %.2fs (%.0f rows/s)", rows, elapsed, rows / elapsed if elapsed else 0)
+    run_counters.log_summary()
+    stop_logging()
+
+if __name__ == "__main__":
+    main()
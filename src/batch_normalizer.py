@@ -0,0 +1,85 @@
+import logging
+import os
+import numpy as np
+import pandas as pd
+from data_handler import parse_description
+
+logger = logging.getLogger(__name__)
+
+def read_frame(input_file, chunksize=None):
+    """
+    Reads the raw CSV as strings, exactly as csv.DictReader sees it. With
+    chunksize, returns an iterator of frames of at most that many rows.
+    """
+    return pd.read_csv(input_file, dtype=str, keep_default_na=False, encoding='latin-1', chunksize=chunksize)
+
+def parse_prices(prices):
+    """
+    Vectorized extract_price: strips "R$", uses "," as decimal point, inf when invalid.
+    """
+    cleaned = prices.str.replace('R$', '', regex=False).str.strip().str.replace(',', '.', regex=False)
+    return pd.to_numeric(cleaned, errors='coerce').fillna(np.inf).to_numpy(dtype=float)
+
+def normalize_frame(frame):
+    """
+    Computes volume, package type, quantity, unit price and price per liter for
+    every row at once. Matches process_product_row row for row.
+    """
+    # Descriptions repeat across stores and runs, so parse each distinct one once.
+    codes, descriptions = pd.factorize(frame['product_description'])
+    volume, volume_value, package, quantity = (np.array(column, dtype=object) for column in
+                                               zip(*map(parse_description, descriptions)))
+    quantity = quantity.astype(int)[codes]
+    volume_value = np.array([np.nan if v is None else v for v in volume_value], dtype=float)[codes]
+
+    frame['volume'] = volume[codes]
+    frame['volume_value'] = pd.array(volume_value, dtype="Int64")
+    frame['package_type'] = package[codes]
+
+    price = parse_prices(frame['product_price'])
+    promo_price = parse_prices(frame['product_discount_price'])
+    min_price = np.minimum(price, promo_price)
+    valid = min_price != np.inf
+
+    with np.errstate(invalid='ignore'):
+        already_unit = (np.round(price / quantity, 2) <= min_price) | (np.round(promo_price / quantity, 2) <= min_price)
+    keep_min = (quantity == 1) | ((price != 0) & (promo_price != np.inf) & already_unit)
+    unit_price = np.where(keep_min, min_price, min_price / quantity)
+    price_per_liter = unit_price / volume_value * 1000
+
+    frame['unit_price'] = np.where(valid, unit_price, np.nan)
+    frame['price_per_liter'] = np.where(valid & ~np.isnan(volume_value), price_per_liter, np.nan)
+    return frame
+
+def column_values(column):
+    """
+    Returns the column as a list of plain Python values, with None for missing ones.
+    """
+    if column.dtype == "Int64":
+        return [None if value is pd.NA else int(value) for value in column]
+    values = column.astype(object)
+    return values.where(column.notna(), None).tolist()
+
+def frame_to_rows(frame):
+    """
+    Converts the normalized frame back to the list of dicts the rest of the pipeline uses.
+    """
+    columns = list(frame.columns)
+    values = [column_values(frame[name]) for name in columns]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+def normalize_file(input_file, chunksize=50000):
+    """
+    Reads and normalizes input_file in chunks of rows, yielding the row dicts
+    so memory is bounded by the chunk size rather than the file size.
+    """
+    logger.info("Normalizing %s in batches of %d rows", input_file, chunksize)
+    if os.path.getsize(input_file) == 0:
+        return
+    count = 0
+    for frame in read_frame(input_file, chunksize):
+        if frame.empty:
+            continue
+        count += len(frame)
+        yield from frame_to_rows(normalize_frame(frame))
+    logger.info("Normalized %d rows from %s", count, input_file)
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from playwright.async_api import async_playwright
+from playwright.sync_api import sync_playwright
+
+
+class BrowserPool:
+    """
+    Fixed set of long-lived headless browsers that hand out isolated contexts.
+
+    Playwright's sync API is bound to the thread that started it, so every
+    browser lives on its own worker thread. Work is submitted to the pool
+    (like a ThreadPoolExecutor) and calls to new_context() made from inside
+    that work get a fresh context on the worker's browser. With a render
+    profile, every context is created with its request blocking applied.
+    """
+
+    def __init__(self, size=5, headless=True, max_pages=50, render_profile=None):
+        self.size = size
+        self.headless = headless
+        self.max_pages = max_pages
+        self.render_profile = render_profile
+        self.launches = 0
+        self.recycles = 0
+        self._tasks = queue.Queue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._alive = size
+        self._startup_error = None
+        self._workers = []
+        for index in range(size):
+            worker = threading.Thread(target=self._run_worker, name=f"browser-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queues fn for the next free worker. Fails the future right away if no
+        worker could start Playwright.
+        """
+        future = Future()
+        with self._lock:
+            if self._alive == 0:
+                future.set_exception(self._startup_error)
+            else:
+                self._tasks.put((future, fn, args, kwargs))
+        return future
+
+    def new_context(self, site_url=None, **context_options):
+        """
+        Returns a new isolated context on the calling worker's browser, set up
+        with the render profile for site_url.
+        """
+        if not hasattr(self._local, "playwright"):
+            raise RuntimeError("new_context() must be called from work submitted to the pool")
+        browser = self._healthy_browser()
+        if self.render_profile is not None:
+            context_options = {**self.render_profile.context_options(), **context_options}
+        context = browser.new_context(**context_options)
+        if self.render_profile is not None:
+            self.render_profile.apply(context, site_url)
+        context.on("page", lambda page: self._page_opened())
+        return context
+
+    def stop(self):
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join()
+        logging.info(f"Browser pool stopped after {self.launches} launches and {self.recycles} recycles")
+
+    def _run_worker(self):
+        try:
+            self._local.playwright = sync_playwright().start()
+        except BaseException as e:
+            logging.error(f"Browser worker {threading.current_thread().name} failed to start: {str(e)}")
+            self._worker_failed(e)
+            return
+        self._local.browser = None
+        self._local.pages_served = 0
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    break
+                future, fn, args, kwargs = task
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+        finally:
+            self._close_browser()
+            self._local.playwright.stop()
+
+    def _worker_failed(self, error):
+        """
+        Counts a worker that could not start. Once none is left, fails every
+        queued task, since nothing would ever run them.
+        """
+        with self._lock:
+            self._alive -= 1
+            self._startup_error = error
+            if self._alive > 0:
+                return
+            while True:
+                try:
+                    task = self._tasks.get_nowait()
+                except queue.Empty:
+                    break
+                if task is not None and task[0].set_running_or_notify_cancel():
+                    task[0].set_exception(error)
+
+    def _page_opened(self):
+        self._local.pages_served += 1
+
+    def _healthy_browser(self):
+        browser = self._local.browser
+        if browser is not None and not browser.is_connected():
+            logging.warning(f"Browser on {threading.current_thread().name} disconnected, relaunching")
+            self._local.browser = browser = None
+        if browser is not None and self._local.pages_served >= self.max_pages and not browser.contexts:
+            logging.info(f"Recycling browser on {threading.current_thread().name} after {self._local.pages_served} pages")
+            self._close_browser()
+            with self._lock:
+                self.recycles += 1
+            browser = None
+        if browser is None:
+            browser = self._local.playwright.chromium.launch(headless=self.headless)
+            self._local.browser = browser
+            self._local.pages_served = 0
+            with self._lock:
+                self.launches += 1
+        return browser
+
+    def _close_browser(self):
+        browser = self._local.browser
+        self._local.browser = None
+        if browser is not None:
+            try:
+                browser.close()
+            except Exception as e:
+                logging.warning(f"Error closing browser: {str(e)}")
+
+class AsyncBrowserPool:
+    """
+    Async counterpart of BrowserPool. A single event loop shares a fixed set of
+    browsers, and each new context goes to the least loaded one.
+    """
+
+    def __init__(self, size=2, headless=True, max_pages=50, render_profile=None):
+        self.size = size
+        self.headless = headless
+        self.max_pages = max_pages
+        self.render_profile = render_profile
+        self.launches = 0
+        self.recycles = 0
+        self._playwright = None
+        self._slots = []
+        self._lock = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    async def start(self):
+        self._playwright = await async_playwright().start()
+        self._slots = [{"name": f"browser-{index}", "browser": None, "pages_served": 0} for index in range(self.size)]
+        self._lock = asyncio.Lock()
+
+    async def new_context(self, site_url=None, **context_options):
+        """
+        Returns a new isolated context on the least loaded browser, set up with
+        the render profile for site_url.
+        """
+        if self.render_profile is not None:
+            context_options = {**self.render_profile.context_options(), **context_options}
+        async with self._lock:
+            slot = min(self._slots, key=lambda s: len(s["browser"].contexts) if s["browser"] else 0)
+            browser = await self._healthy_browser(slot)
+            context = await browser.new_context(**context_options)
+        if self.render_profile is not None:
+            await self.render_profile.apply_async(context, site_url)
+        context.on("page", lambda page: self._page_opened(slot))
+        return context
+
+    async def stop(self):
+        for slot in self._slots:
+            await self._close_browser(slot)
+        await self._playwright.stop()
+        logging.info(f"Browser pool stopped after {self.launches} launches and {self.recycles} recycles")
+
+    def _page_opened(self, slot):
+        slot["pages_served"] += 1
+
+    async def _healthy_browser(self, slot):
+        browser = slot["browser"]
+        if browser is not None and not browser.is_connected():
+            logging.warning(f"{slot['name']} disconnected, relaunching")
+            slot["browser"] = browser = None
+        if browser is not None and slot["pages_served"] >= self.max_pages and not browser.contexts:
+            logging.info(f"Recycling {slot['name']} after {slot['pages_served']} pages")
+            await self._close_browser(slot)
+            self.recycles += 1
+            browser = None
+        if browser is None:
+            browser = await self._playwright.chromium.launch(headless=self.headless)
+            slot["browser"] = browser
+            slot["pages_served"] = 0
+            self.launches += 1
+        return browser
+
+    async def _close_browser(self, slot):
+        browser = slot["browser"]
+        slot["browser"] = None
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception as e:
+                logging.warning(f"Error closing {slot['name']}: {str(e)}")
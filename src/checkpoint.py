@@ -0,0 +1,122 @@
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+# The store answered but does not carry the item: final, never re-crawled on resume.
+NOT_FOUND = "not_found"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    output_file TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    url TEXT NOT NULL,
+    item TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (run_id, url, item)
+);
+"""
+
+class RunManifest:
+    """
+    SQLite checkpoint of every (url, item) task in a crawl run, so a run that
+    crashed or partly failed can be resumed into the same output file without
+    crawling the completed pairs again.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # Tasks are marked from the browser workers and the CSV writer thread.
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def start_run(self, run_id, output_file, urls, items):
+        """
+        Records a new run and queues a pending task for every url and item.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("INSERT INTO runs (run_id, output_file, started_at) VALUES (?, ?, ?)",
+                                   (run_id, output_file, now))
+            except sqlite3.IntegrityError:
+                raise ValueError(f"Run {run_id} already exists") from None
+            self._conn.executemany("INSERT OR IGNORE INTO tasks (run_id, url, item, state, updated_at) VALUES (?, ?, ?, ?, ?)",
+                                   [(run_id, url, item, PENDING, now) for url in urls for item in items])
+        logger.info("Started run %s with %d tasks", run_id, len(urls) * len(items))
+
+    def latest_run(self):
+        """
+        Returns the id of the most recent run with tasks left to crawl (pending
+        or failed), or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT run_id FROM runs WHERE run_id IN (SELECT run_id FROM tasks WHERE state IN (?, ?)) "
+                "ORDER BY started_at DESC LIMIT 1", (PENDING, FAILED)).fetchone()
+        return row[0] if row else None
+
+    def output_file(self, run_id):
+        with self._lock:
+            row = self._conn.execute("SELECT output_file FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return row[0] if row else None
+
+    def remaining_tasks(self, run_id):
+        """
+        Returns {url: [items]} for the tasks of run_id that are pending or failed.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT url, item FROM tasks WHERE run_id = ? AND state IN (?, ?) ORDER BY url, item",
+                                      (run_id, PENDING, FAILED)).fetchall()
+        remaining = {}
+        for url, item in rows:
+            remaining.setdefault(url, []).append(item)
+        return remaining
+
+    def mark_done(self, run_id, url, item):
+        self._mark(run_id, url, item, DONE, None)
+
+    def mark_failed(self, run_id, url, item, error):
+        self._mark(run_id, url, item, FAILED, str(error))
+
+    def mark_not_found(self, run_id, url, item, reason):
+        self._mark(run_id, url, item, NOT_FOUND, str(reason))
+
+    def finish_run(self, run_id):
+        """
+        Closes run_id once no task is pending and returns the task count per
+        state. Failed tasks can still be resumed; not-found ones are final.
+        """
+        with self._lock, self._conn:
+            counts = dict(self._conn.execute("SELECT state, COUNT(*) FROM tasks WHERE run_id = ? GROUP BY state",
+                                             (run_id,)).fetchall())
+            if PENDING not in counts:
+                self._conn.execute("UPDATE runs SET finished_at = ? WHERE run_id = ?", (time.time(), run_id))
+        logger.info("Run %s tasks: %s", run_id, counts)
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _mark(self, run_id, url, item, state, error):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET state = ?, error = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE run_id = ? AND url = ? AND item = ?",
+                (state, error, time.time(), run_id, url, item))
@@ -0,0 +1,123 @@
+import logging
+import os
+import re
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+RUN_TIMESTAMP_PATTERN = re.compile(r"(\d{2}\.\d{2}\.\d{4}_\d{2}\.\d{2})(\.\d{2})?")
+
+COLUMN_TYPES = {
+    "run_timestamp": "timestamp",
+    "url": "string",
+    "item": "string",
+    "product_description": "string",
+    "product_price": "float",
+    "product_discount_price": "float",
+    "volume": "string",
+    "volume_value": "int",
+    "package_type": "string",
+    "unit_price": "float",
+    "price_per_liter": "float",
+}
+
+def run_timestamp_for(input_file):
+    """
+    Returns the run timestamp encoded in a price_verification_<date>_<time>.csv name,
+    with or without seconds, falling back to the file's modification time.
+    """
+    match = RUN_TIMESTAMP_PATTERN.search(os.path.basename(input_file))
+    if match:
+        return datetime.strptime(match.group(1), "%d.%m.%Y_%H.%M").replace(second=int((match.group(2) or ".0")[1:]))
+    return datetime.fromtimestamp(os.path.getmtime(input_file))
+
+def price_or_none(value):
+    """
+    Converts a scraped price ("R$ 4,99") or computed float to a float, or None.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return None if value == float('inf') else float(value)
+    try:
+        return float(str(value).replace('R$', '').strip().replace(',', '.'))
+    except ValueError:
+        return None
+
+def arrow_schema():
+    arrow_types = {
+        "timestamp": pa.timestamp("s"),
+        "string": pa.string(),
+        "float": pa.float64(),
+        "int": pa.int32(),
+    }
+    return pa.schema([(name, arrow_types[kind]) for name, kind in COLUMN_TYPES.items()])
+
+def to_columns(data, run_timestamp):
+    """
+    Converts processed rows into typed columns.
+    """
+    columns = {name: [] for name in COLUMN_TYPES}
+    for row in data:
+        for name, kind in COLUMN_TYPES.items():
+            value = run_timestamp if name == "run_timestamp" else row.get(name)
+            if kind == "float":
+                value = price_or_none(value)
+            elif kind == "int":
+                value = int(value) if value not in (None, "") else None
+            columns[name].append(value)
+    return columns
+
+def write_columnar_rows(rows, input_file, output_format="parquet", batch_size=10000):
+    """
+    Writes the processed rows next to input_file as Parquet or Arrow IPC while
+    they pass through, yielding each one on. Rows are converted in batches of
+    batch_size so the whole file is never held in memory.
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required for columnar output (pip install pyarrow)")
+    if output_format not in ("parquet", "arrow"):
+        raise ValueError(f"Unknown columnar format: {output_format}")
+    run_timestamp = run_timestamp_for(input_file)
+    schema = arrow_schema()
+    output_file = f"{input_file}_processed.{output_format}"
+    if output_format == "parquet":
+        writer = pq.ParquetWriter(output_file, schema)
+        sink = None
+    else:
+        sink = pa.OSFile(output_file, "wb")
+        writer = pa.ipc.new_file(sink, schema)
+    count = 0
+    batch = []
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                writer.write_table(pa.Table.from_pydict(to_columns(batch, run_timestamp), schema=schema))
+                count += len(batch)
+                batch = []
+            yield row
+        # Write even an empty batch so the file always has the schema.
+        writer.write_table(pa.Table.from_pydict(to_columns(batch, run_timestamp), schema=schema))
+        count += len(batch)
+    finally:
+        writer.close()
+        if sink is not None:
+            sink.close()
+    logger.info("Wrote %d rows to %s", count, output_file)
+
+def write_columnar(data, input_file, output_format="parquet"):
+    """
+    Writes the processed rows next to input_file as Parquet or Arrow IPC and
+    returns the output path.
+    """
+    for _ in write_columnar_rows(data, input_file, output_format):
+        pass
+    return f"{input_file}_processed.{output_format}"
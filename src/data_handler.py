@@ -1,24 +1,31 @@
 import csv
 import re
 import logging
+import queue
+import threading
 from collections import defaultdict
-import time
-from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from columnar_sink import write_columnar_rows, run_timestamp_for
+from price_history import run_id_for
+from top_offers import TopOffers, write_top_offers, print_top_offers
+from logger import run_counters
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
 
 # Define dictionaries
-volume_beer_unit = {
-    "5l": 5000,
-    "600ml": 600,
-    "350ml": 350,
-    "330ml": 330,
-    "275ml": 275,
-    "269ml": 269,
-    "250ml": 250,
-    "210ml": 210
+volume_unit_ml = {
+    "ml": 1,
+    "l": 1000,
+    "lt": 1000,
+    "lts": 1000,
+    "litro": 1000,
+    "litros": 1000
 }
 
 package_type = {
     "lata": "lata",
+    "latinha": "lata",
     "garrafa": "garrafa",
     "longneck": "garrafa",
     "ln": "garrafa",
@@ -26,142 +33,286 @@ package_type = {
     "keg": "barril"
 }
 
-def save_json_as_csv(json_data, file_name, url, item):
+# One alternation per attribute. The lookbehind keeps "5l" from matching inside
+# "1.5l", and the word boundaries keep "ln" from matching inside other words.
+DESCRIPTION_PATTERN = re.compile(
+    r"(?<![\d.,])(?P<amount>\d+(?:[.,]\d+)?)\s*(?P<unit>ml|litros?|lts?|l)\b"
+    r"|\b(?P<quantity>\d+)\s*(?:unidades?|und|pack|pacote|caixa|cx|un|pç)\b"
+    r"|\b(?:pack|caixa|cx|c/)\s*(?:com\s*)?(?P<quantity_after>\d+)\b(?!\s*(?:ml|l|lts?|litros?)\b)"
+    r"|\b(?P<package>latas?|latinhas?|garrafas?|long\s*-?\s*necks?|ln|barril|keg)\b",
+    re.IGNORECASE
+)
+
+CSV_HEADER = [
+    "url", "item", "product_description", "product_price", "product_discount_price"
+]
+
+PROCESSED_FIELDS = ["volume", "volume_value", "package_type", "unit_price", "price_per_liter"]
+
+class CsvWriter:
+    """
+    Owns a single buffered handle on a CSV file. Rows are queued from any thread
+    and written in batches by a background thread, so callers never block on disk.
+    If the writer thread fails, its error is raised from write_rows and close,
+    and no more rows are accepted.
     """
-    Saves the product data in JSON format to a CSV file.
+    def __init__(self, file_name, header=CSV_HEADER, batch_size=200, flush_interval=1.0):
+        self.file_name = file_name
+        self.header = header
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="csv-writer", daemon=True)
+        self._thread.start()
+
+    def write_rows(self, rows, on_written=None):
+        """
+        Queues rows to be written together, without interleaving with other callers.
+        on_written is called from the writer thread once the rows are flushed to disk.
+        """
+        if self.error is not None:
+            raise self.error
+        if rows:
+            self._queue.put((rows, on_written))
+        elif on_written:
+            on_written()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+        logger.info("Wrote %d rows to %s", self.rows_written, self.file_name)
+
+    def _run(self):
+        try:
+            self._write_queued()
+        except BaseException as e:
+            self.error = e
+            logger.error("CSV writer for %s failed: %s", self.file_name, e)
+
+    def _write_queued(self):
+        with open(self.file_name, "a", newline="") as file:
+            writer = csv.writer(file)
+            if file.tell() == 0:
+                writer.writerow(self.header)
+            pending = 0
+            while True:
+                try:
+                    rows = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    if pending:
+                        with tracer.span("csv.flush", file=self.file_name):
+                            file.flush()
+                        pending = 0
+                    continue
+                if rows is None:
+                    break
+                rows, on_written = rows
+                # The disk write itself; save_json_as_csv only measures queueing.
+                with tracer.span("csv.write", file=self.file_name, rows=len(rows)):
+                    writer.writerows(rows)
+                    self.rows_written += len(rows)
+                    pending += len(rows)
+                    if on_written or pending >= self.batch_size:
+                        file.flush()
+                        pending = 0
+                if on_written:
+                    on_written()
+
+_csv_writers = {}
+_csv_writers_lock = threading.Lock()
+
+def get_csv_writer(file_name):
     """
-    logging.info(f"Saving data from {url} for item {item} to {file_name}")
-    csv_header = [
-        "url", "item", "product_description", "product_price", "product_discount_price"
-    ]
+    Returns the shared writer for file_name, starting it on first use.
+    """
+    with _csv_writers_lock:
+        if file_name not in _csv_writers:
+            _csv_writers[file_name] = CsvWriter(file_name)
+        return _csv_writers[file_name]
+
+def close_csv_writers():
+    """
+    Flushes and closes every open writer. Call before reading the files back.
+    Raises the first writer error once all of them are closed.
+    """
+    with _csv_writers_lock:
+        writers = list(_csv_writers.values())
+        _csv_writers.clear()
+    error = None
+    for writer in writers:
+        try:
+            writer.close()
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        raise error
+
+def save_json_as_csv(json_data, file_name, url, item, on_written=None):
+    """
+    Queues the product data in JSON format to be written to a CSV file.
+    on_written is called once the rows are on disk.
+    """
+    logger.info("Saving data from %s for item %s to %s", url, item, file_name)
     products = json_data.get("results", {}).get("products", [])
-    with open(file_name, "a", newline="") as file:
-        writer = csv.writer(file)
-        if file.tell() == 0:
-            writer.writerow(csv_header)
-        for product in products:
-            product_description = product.get("product_description", "").lower()
-            if product_description.startswith("cerveja"):
-                product_price = product.get("product_price", "")
-                product_discount_price = product.get("product_discount_price", "")
-                writer.writerow(
-                    [url, item, product_description, product_price, product_discount_price]
-                )
-    logging.info(f"Saved {len(products)} products from {url} to {file_name}")
-    time.sleep(1)
+    rows = []
+    for product in products:
+        product_description = product.get("product_description", "").lower()
+        if product_description.startswith("cerveja"):
+            product_price = product.get("product_price", "")
+            product_discount_price = product.get("product_discount_price", "")
+            rows.append([url, item, product_description, product_price, product_discount_price])
+    get_csv_writer(file_name).write_rows(rows, on_written)
+    run_counters.increment("rows_saved", len(rows))
+    logger.info("Queued %d of %d products from %s for %s", len(rows), len(products), url, file_name)
+
+@lru_cache(maxsize=65536)
+def parse_description(description):
+    """
+    Extracts volume, volume in ml, package type and quantity from the product
+    description in a single pass. Returns (volume, volume_value, package, quantity).
+    """
+    volume, volume_value, package, quantity = None, None, None, None
+    for match in DESCRIPTION_PATTERN.finditer(description):
+        if match.group("amount") is not None:
+            if volume is None:
+                amount = match.group("amount").replace(",", ".")
+                unit = match.group("unit").lower()
+                volume = f"{amount}{'ml' if unit == 'ml' else 'l'}"
+                volume_value = round(float(amount) * volume_unit_ml[unit])
+        elif match.group("package") is not None:
+            if package is None:
+                token = re.sub(r"[\s-]", "", match.group("package").lower())
+                package = package_type.get(token, package_type.get(token.rstrip("s")))
+        elif quantity is None:
+            quantity = int(match.group("quantity") or match.group("quantity_after"))
+    logger.debug("Parsed description %r: volume=%s, package=%s, quantity=%s", description, volume, package, quantity)
+    return volume, volume_value, package, quantity or 1
 
 def extract_quantity(description):
     """
     Extracts the quantity of units from the product description.
     """
-    logging.debug(f"Extracting quantity from description: {description}")
-    match = re.search(r'\b(\d+)\s*(?:unidades?|und|pack|pacote|caixa|cx|un|pç)\b', description, re.IGNORECASE)
-    # test r"\b(-?\d+(?:\.\d+)?)\s*(?:pack|caixa|cx|unidade|unidades|und)\b / old r'\b(\d+)\s*(?:unidades?|und|pack|pacote|caixa|cx|un|pç)\b'"
-    if match:
-        quantity = int(match.group(1))
-        logging.debug(f"Found quantity: {quantity}")
-        return quantity
-    else:
-        logging.debug("No quantity found, assuming 1.")
-        return 1
+    return parse_description(description)[3]
 
 def extract_volume_and_package(description):
     """
     Extracts the volume and package type from the product description.
     """
-    logging.debug(f"Extracting volume and package from description: {description}")
-    volume, volume_value, package = None, None, None
-    description = description.replace(" ", "")
-    for key, value in volume_beer_unit.items():
-        if key in description:
-            volume, volume_value = key, value
-            logging.debug(f"Found volume: {volume}, Value: {volume_value}")
-            break
-    for key, value in package_type.items():
-        if key in description:
-            package = value
-            logging.debug(f"Found package: {package}")
-            break
-    return volume, volume_value, package
+    return parse_description(description)[:3]
 
 def extract_price(price_str):
     """
     Extracts and converts the price from string to float.
     """
-    logging.debug(f"Extracting price from string: {price_str}")
     price_str = price_str.replace('R$', '').strip().replace(',', '.')
     try:
         price = float(price_str)
-        logging.debug(f"Extracted price: {price}")
+        logger.debug("Extracted price %s from %r", price, price_str)
         return price
     except ValueError:
-        logging.warning(f"Invalid price encountered: {price_str}")
+        run_counters.increment("invalid_price_strings")
+        logger.debug("Invalid price encountered: %r", price_str)
         return float('inf')  # Assign infinity as the sentinel value for invalid prices
 
 def calculate_unit_price(min_price, price, promo_price, quantity):
     """
     Calculates the unit price of the product. Logs potential data issues.
     """
-    logging.debug(f"Calculating unit price with Min Price: {min_price}, Price: {price}, Promo Price: {promo_price}, Quantity: {quantity}")
     if quantity == 1:
-        logging.debug(f"Quantity is 1, unit price is min_price: {min_price}")
+        logger.debug("Quantity is 1, unit price is min_price: %s", min_price)
         return min_price
     else:
         if price and promo_price != float('inf'):
             if round(price / quantity, 2) <= min_price or round(promo_price / quantity, 2) <= min_price:
-                logging.debug(f"Unit price calculated from price/promo_price divided by quantity: {min_price}")
+                logger.debug("Unit price calculated from price/promo_price divided by quantity: %s", min_price)
                 return min_price
             else:
-                logging.warning(f"Assuming min_price ({min_price}) is total price. "
-                                f"Price: {price}, Promo Price: {promo_price}, Quantity: {quantity}")
+                run_counters.increment("assumed_total_price")
+                logger.debug("Assuming min_price (%s) is total price. Price: %s, Promo Price: %s, Quantity: %s",
+                             min_price, price, promo_price, quantity)
                 return min_price / quantity
         else:
-            logging.warning(f"Invalid price detected. Assuming min_price ({min_price}) is total price. "
-                            f"Price: {price}, Promo Price: {promo_price}, Quantity: {quantity}")
+            run_counters.increment("assumed_total_price")
+            logger.debug("Invalid price detected. Assuming min_price (%s) is total price. "
+                         "Price: %s, Promo Price: %s, Quantity: %s", min_price, price, promo_price, quantity)
             return min_price / quantity
 
 def calculate_price_per_liter(unit_price, volume_value):
     """
     Calculates the price per liter of the product.
     """
-    logging.debug(f"Calculating price per liter with Unit Price: {unit_price}, Volume Value: {volume_value}")
     price_per_liter = unit_price / volume_value * 1000
-    logging.debug(f"Calculated price per liter: {price_per_liter}")
+    logger.debug("Calculated price per liter %s from unit price %s and volume %s", price_per_liter, unit_price, volume_value)
     return price_per_liter
 
-def process_csv(input_file):
+def process_csv(input_file, columnar=None, engine="rows", history=None, top_k=5):
     """
     Processes the input CSV file to calculate unit prices and prices per liter,
-    and writes the modified data to an output CSV file.
-    """
-    logging.info(f"Starting processing of {input_file}")
-    data = read_csv(input_file)
-    
-    # Use ThreadPoolExecutor to process data in parallel
-    with ThreadPoolExecutor() as executor:
-        data = list(executor.map(process_product_row, data))
-    
-    output_file = write_processed_data(input_file, data)
-    find_and_print_lowest_prices(data)
-    logging.info(f"Completed processing of {input_file}")
+    and writes the modified data to an output CSV file. With columnar set to
+    "parquet" or "arrow", a typed columnar copy is written alongside it.
+    engine="pandas" normalizes the file in chunks with the same results.
+    With a PriceHistory, the run is recorded there and the lowest prices are
+    queried from it. The top_k cheapest offers per item, volume and package
+    type are printed and written to <input_file>_top_offers.csv.
+
+    Rows stream through read, normalize, write and the running minima in one
+    pass, so memory stays constant however large the input is.
+    """
+    logger.info("Starting processing of %s", input_file)
+    if engine == "pandas":
+        from batch_normalizer import normalize_file
+        rows = normalize_file(input_file)
+    else:
+        # Normalization is pure-Python string work, so threads only add GIL contention.
+        rows = (process_product_row(row) for row in read_csv(input_file))
+
+    output_file = f"{input_file}_processed.csv"
+    rows = write_processed_rows(output_file, processed_fieldnames(input_file), rows)
+    if columnar:
+        rows = write_columnar_rows(rows, input_file, columnar)
+    top_offers = TopOffers(top_k)
+    rows = top_offers.track(rows)
+    if history:
+        run_timestamp = run_timestamp_for(input_file)
+        history.record_snapshot(rows, run_timestamp)
+        print_lowest_prices(history.lowest_price_per_type(run_id_for(run_timestamp)))
+    else:
+        print_lowest_prices(find_lowest_price_per_type(rows))
+    offers = top_offers.result()
+    write_top_offers(f"{input_file}_top_offers.csv", offers)
+    print_top_offers(offers)
+    logger.info("Completed processing of %s", input_file)
     return output_file
 
 def read_csv(input_file):
     """
-    Reads the input CSV file and returns the data as a list of dictionaries.
+    Reads the input CSV file and yields each row as a dictionary.
+    """
+    logger.info("Reading data from %s", input_file)
+    count = 0
+    with open(input_file, mode='r', newline='', encoding='latin-1') as infile:
+        for row in csv.DictReader(infile):
+            count += 1
+            yield row
+    logger.info("Read %d rows from %s", count, input_file)
+
+def processed_fieldnames(input_file):
+    """
+    Returns the input header followed by the computed columns.
     """
-    logging.info(f"Reading data from {input_file}")
     with open(input_file, mode='r', newline='', encoding='latin-1') as infile:
-        reader = csv.DictReader(infile)
-        data = [row for row in reader]
-    logging.info(f"Read {len(data)} rows from {input_file}")
-    return data
+        header = next(csv.reader(infile), [])
+    return header + [name for name in PROCESSED_FIELDS if name not in header]
 
 def process_product_row(row):
     """
     Processes a single product row to extract volume, package type, and calculate prices.
     """
-    logging.debug(f"Processing row: {row}")
+    run_counters.increment("rows_processed")
     description = row['product_description']
     volume, volume_value, package = extract_volume_and_package(description)
     row['volume'] = volume
@@ -173,39 +324,60 @@ def process_product_row(row):
 
     min_price = min(price, promo_price)
     if min_price == float('inf'):
-        logging.warning(f"Skipping row due to invalid price: {row}")
+        run_counters.increment("rows_invalid_price")
+        logger.debug("Skipping row due to invalid price: %s", row)
         return row  # Skip rows with invalid prices
 
     quantity = extract_quantity(description)
     unit_price = calculate_unit_price(min_price, price, promo_price, quantity)
     row['unit_price'] = unit_price
 
+    if volume_value is None:
+        run_counters.increment("rows_without_volume")
+        logger.debug("No volume found, skipping price per liter: %s", row)
+        row['price_per_liter'] = None
+        return row
+
     price_per_liter = calculate_price_per_liter(unit_price, volume_value)
     row['price_per_liter'] = price_per_liter
 
-    logging.debug(f"Processed row: {row}")
+    logger.debug("Processed row: %s", row)
     return row
 
-def write_processed_data(input_file, data):
+def write_processed_rows(output_file, fieldnames, rows):
     """
-    Writes the processed data to a new CSV file and returns the output file path.
+    Writes rows to output_file as they pass through, yielding each one on.
     """
-    logging.info(f"Writing processed data to output file")
-    fieldnames = data[0].keys()
-    output_file = f"{input_file}_processed.csv"
+    logger.info("Writing processed data to %s", output_file)
+    count = 0
     with open(output_file, mode='w', newline='', encoding='utf-8') as outfile:
+        # Rows skipped for invalid prices lack the computed columns and get blanks.
         writer = csv.DictWriter(outfile, fieldnames=fieldnames)
         writer.writeheader()
-        writer.writerows(data)
-    logging.info(f"Wrote processed data to {output_file}")
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+            yield row
+    logger.info("Wrote %d processed rows to %s", count, output_file)
+
+def write_processed_data(input_file, data):
+    """
+    Writes the processed data to a new CSV file and returns the output file path.
+    """
+    output_file = f"{input_file}_processed.csv"
+    fieldnames = processed_fieldnames(input_file)
+    for _ in write_processed_rows(output_file, fieldnames, data):
+        pass
     return output_file
 
 def find_and_print_lowest_prices(data):
     """
     Finds and prints the lowest price per liter for each type of product.
     """
-    logging.info("Finding and printing lowest prices per product type")
-    lowest_prices = find_lowest_price_per_type(data)
+    logger.info("Finding and printing lowest prices per product type")
+    print_lowest_prices(find_lowest_price_per_type(data))
+
+def print_lowest_prices(lowest_prices):
     for product_type, info in lowest_prices.items():
         lowest_price = info['price']
         lowest_product = info['product']
@@ -225,7 +397,7 @@ def find_lowest_price_per_type(data):
     """
     Finds the lowest price per liter for each type of item in the data.
     """
-    logging.debug("Finding the lowest price per product type")
+    logger.debug("Finding the lowest price per product type")
     lowest_prices = defaultdict(lambda: {'price': float('inf'), 'product': None})
     for row in data:
         try:
@@ -236,14 +408,16 @@ def find_lowest_price_per_type(data):
                 lowest_prices[product_type]['price'] = price_per_liter
                 lowest_prices[product_type]['product'] = row
             elif price_per_liter == lowest_prices[product_type]['price'] and row['url'] != lowest_prices[product_type]['product']['url']:
-                lowest_prices[product_type]['product']['url'] += ', ' + row['url']
+                # Copy rather than append to the stored row, which is also written out.
+                product = lowest_prices[product_type]['product']
+                lowest_prices[product_type]['product'] = {**product, 'url': product['url'] + ', ' + row['url']}
         
         except TypeError as e:
-            logging.warning(f"Skipping row due to TypeError: {e}")
+            logger.debug("Skipping row due to TypeError: %s", e)
             continue
         
         except KeyError as e:
-            logging.warning(f"Skipping row due to missing key: {e}")
+            logger.warning("Skipping row due to missing key: %s", e)
             continue
 
     return lowest_prices
\ No newline at end of file
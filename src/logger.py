@@ -0,0 +1,66 @@
+import logging
+import logging.handlers
+import queue
+import threading
+from collections import Counter
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+
+_listener = None
+
+def setup_logging(log_file, level=logging.INFO, debug_modules=()):
+    """
+    Routes all logging through a queue to a background thread that writes log_file,
+    so callers never wait on disk. Modules listed in debug_modules (e.g.
+    "data_handler") log at DEBUG; everything else logs at level.
+    """
+    global _listener
+    stop_logging()
+    log_queue = queue.SimpleQueue()
+    file_handler = logging.FileHandler(log_file, mode='w', encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+    for module in debug_modules:
+        if module:
+            logging.getLogger(module.strip()).setLevel(logging.DEBUG)
+
+def stop_logging():
+    """
+    Flushes queued records to disk and stops the background listener.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+class RunCounters:
+    """
+    Thread-safe named counters, summarized once at the end of a run.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def summary(self):
+        with self._lock:
+            return dict(sorted(self._counts.items()))
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    def log_summary(self):
+        logging.getLogger(__name__).info("Run summary: %s", self.summary())
+
+run_counters = RunCounters()
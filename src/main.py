@@ -1,13 +1,28 @@
 from dotenv import load_dotenv
 from datetime import datetime
+import argparse
 import json
 import time
 import logging
 import random
+import os
+from browser_pool import BrowserPool
 from session_manager import SessionManager
 from site_logic import SiteLogic
-from data_handler import save_json_as_csv, process_csv
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from data_handler import save_json_as_csv, close_csv_writers, process_csv
+from readiness import readiness_stats
+from logger import setup_logging, stop_logging, run_counters
+from selector_cache import SelectorCache
+from session_store import SessionStore
+from rate_limiter import RateLimiter, backoff_delay
+from site_adapters import product_identity
+from checkpoint import RunManifest
+from price_history import PriceHistory
+from tracing import tracer
+from render_profile import RenderProfile
+from api_extraction import ApiEndpoints, api_client
+from results_cache import ResultsCache, parse_max_age
+from concurrent.futures import as_completed
 
 load_dotenv()
 
@@ -20,51 +35,206 @@ urls = [
 ]
 shopping_list = ["Stella", "Becks", "Corona", "Heineken"]
 data_folder = "D:\\ProjectsAI\\WebBuyer\\data\\"
+columnar_output = os.getenv("COLUMNAR_OUTPUT")  # "parquet", "arrow" or unset
+normalization_engine = os.getenv("NORMALIZATION_ENGINE", "rows")  # "rows" or "pandas"
+pool_size = int(os.getenv("BROWSER_POOL_SIZE", 5))
+max_pages_per_browser = int(os.getenv("BROWSER_MAX_PAGES", 50))
+crawl_mode = os.getenv("CRAWL_MODE", "items")  # "items" or "category" (one listing fanned out to all items)
+render_mode = os.getenv("RENDER_PROFILE", "light")  # "light" blocks images, media, fonts and trackers; "full" loads all
 
-current_date_time = datetime.now().strftime("%d.%m.%Y_%H.%M")
+current_date_time = datetime.now().strftime("%d.%m.%Y_%H.%M.%S")  # also the manifest run id
 file_name = f"{data_folder}price_verification_{current_date_time}.csv"
 
-logging.basicConfig(level=logging.DEBUG, filename=f"{data_folder}log_{current_date_time}.log", filemode='w',
-                    format='%(asctime)s - %(levelname)s - %(message)s')
-
-def handle_url(url):
-    session_manager = SessionManager(url)
-    site_logic = SiteLogic(session_manager.session, url)
-    site_logic.set_postal_code()
-    max_retries = 3
-    local_shopping_list = shopping_list[:]
-    random.shuffle(local_shopping_list)
-    for item in local_shopping_list:
-        retries = 0
-        while retries < max_retries:
+setup_logging(f"{data_folder}log_{current_date_time}.log",
+              debug_modules=os.getenv("DEBUG_MODULES", "").split(","))  # e.g. "data_handler,site_logic"
+
+selector_cache = SelectorCache(f"{data_folder}selector_cache.json")
+api_endpoints = ApiEndpoints(f"{data_folder}api_endpoints.json")
+session_store = SessionStore(f"{data_folder}sessions", max_age_hours=int(os.getenv("SESSION_MAX_AGE_HOURS", 24)))
+rate_limiter = RateLimiter()
+max_attempts = 3
+manifest = RunManifest(f"{data_folder}run_manifest.sqlite3")
+price_history = PriceHistory(f"{data_folder}price_history.sqlite3")
+trace_file = os.getenv("TRACE_FILE")  # optional OTLP/JSON span export path
+tracer.record_spans(bool(trace_file))
+render_profile = RenderProfile() if render_mode == "light" else None
+results_cache = ResultsCache(f"{data_folder}results_cache.sqlite3",
+                             max_bytes=int(float(os.getenv("RESULTS_CACHE_MAX_MB", 64)) * 1024 * 1024))
+max_age = parse_max_age(os.getenv("RESULTS_CACHE_MAX_AGE", "0"))  # e.g. "2h"; 0 always crawls, overridden by --max-age
+postal_code = os.getenv("POSTAL_CODE", "")
+run_id = current_date_time
+
+def with_retries(url, label, call):
+    """
+    Runs call under the domain's rate limit and returns its result. This is the
+    only retry layer: each retry draws on the run-wide budget after a jittered
+    backoff. Raises the last error once retries are exhausted. Response times
+    reach the limiter from SiteLogic's own requests, not from call as a whole.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        with tracer.span("rate_limit.wait"):
+            rate_limiter.wait(url)
+        try:
+            with tracer.span("attempt", attempt=attempt):
+                result = call()
+        except ValueError:
+            rate_limiter.record_success()
+            raise  # No need to retry on ValueError
+        except Exception as e:
+            if not rate_limiter.should_retry(attempt, max_attempts):
+                raise
+            delay = backoff_delay(attempt)
+            logging.warning(f"Error processing {label} at {url}: {str(e)} - Retry {attempt}/{max_attempts - 1} in {delay:.1f}s")
+            with tracer.span("retry.backoff", attempt=attempt):
+                time.sleep(delay)
+            continue
+        rate_limiter.record_success()
+        return result
+
+def save_item_results(search_results, url, item, from_cache=False):
+    logging.info(f"Successfully processed {item} results at {url}" + (" from cache" if from_cache else ""))
+    if not from_cache:
+        results_cache.put(url, item, postal_code, search_results)
+    with tracer.span("save_json_as_csv", url=url, item=item):
+        save_json_as_csv(search_results, file_name, url, item,
+                         on_written=lambda: manifest.mark_done(run_id, url, item))
+
+def search_with_retries(site_logic, url, item):
+    with tracer.span("crawl_task", url=url, item=item):
+        try:
+            search_results = with_retries(url, item, lambda: site_logic.search_item(item))
+        except ValueError as ve:
+            logging.error(f"ValueError processing {item} at {url}: {str(ve)}")
+            manifest.mark_not_found(run_id, url, item, ve)
+            return
+        except Exception as e:
+            logging.error(f"Failed to process {item} at {url}: {str(e)}")
+            manifest.mark_failed(run_id, url, item, e)
+            return
+        save_item_results(search_results, url, item)
+
+def serve_cached(url, items):
+    """
+    Saves the cached results younger than max_age for items at url and returns
+    the items that still need crawling.
+    """
+    if not max_age:
+        return items
+    remaining = []
+    for item in items:
+        cached = results_cache.get(url, item, postal_code, max_age)
+        if cached is None:
+            remaining.append(item)
+        else:
+            save_item_results(cached, url, item, from_cache=True)
+    return remaining
+
+def crawl_category(site_logic, url, items):
+    """
+    Extracts the site's category listing page by page and fans the products out
+    to items locally, so queries scale with pages rather than items. Stops at
+    the first page with no new products. Returns the items it found nothing for.
+    """
+    max_pages = site_logic.adapter.category["max_pages"]
+    products, seen, pages = [], set(), 0
+    with tracer.span("crawl_category", url=url):
+        for page in range(1, max_pages + 1):
             try:
-                search_results = site_logic.search_item(item)
-                logging.info(f"Successfully processed {item} results at {url}")
-                save_json_as_csv(search_results, file_name, url, item)
-                break  # Break the retry loop if successful
-            except ValueError as ve:
-                logging.error(f"ValueError processing {item} at {url}: {str(ve)}")
-                break  # No need to retry on ValueError
+                page_products = with_retries(url, f"category page {page}",
+                                             lambda: site_logic.category_page(page))
             except Exception as e:
-                logging.error(f"Unexpected error processing {item} at {url}: {str(e)} - Retry {retries + 1}")
-                retries += 1
-                if retries < max_retries:
-                    time.sleep(2 ** retries)  # Exponential backoff
-                else:
-                    logging.error(f"Failed to process {item} at {url} after {max_retries} retries.")
-        time.sleep(2)
-    session_manager.stop()
+                logging.error(f"Failed to process category page {page} at {url}: {str(e)}")
+                break
+            new_products = [p for p in page_products if product_identity(p) not in seen]
+            if not new_products:
+                break
+            seen.update(product_identity(p) for p in new_products)
+            products.extend(new_products)
+            pages += 1
+    logging.info(f"Category crawl at {url} found {len(products)} products in {pages} pages")
+    matches = site_logic.adapter.fan_out(products, items)
+    for item, item_products in matches.items():
+        save_item_results({"results": {"products": item_products}}, url, item)
+    return [item for item in items if item not in matches]
+
+def handle_url(url, pool, items):
+    items = serve_cached(url, items)
+    if not items:
+        return
+    session_manager = SessionManager(url, pool, storage_state=session_store.load(url))
+    try:
+        site_logic = SiteLogic(session_manager.session, url, selector_cache=selector_cache, rate_limiter=rate_limiter,
+                               api_endpoints=api_endpoints)
+        with tracer.span("setup", url=url):
+            site_logic.setup(session_store)
+        local_shopping_list = items[:]
+        if crawl_mode == "category" and site_logic.adapter.category:
+            local_shopping_list = crawl_category(site_logic, url, local_shopping_list)
+        random.shuffle(local_shopping_list)
+        for item in local_shopping_list:
+            search_with_retries(site_logic, url, item)
+    finally:
+        session_manager.stop()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Crawl the stores for the shopping list prices.")
+    parser.add_argument("--resume", nargs="?", const="latest", metavar="RUN_ID",
+                        help="continue a previous run (default: the latest one with pending or failed tasks), "
+                             "crawling only its pending and failed tasks into the same output file")
+    parser.add_argument("--max-age", type=parse_max_age, metavar="AGE",
+                        help="serve items crawled within AGE (e.g. 90s, 30m, 2h) from the results cache")
+    return parser.parse_args()
+
+def start_or_resume(resume):
+    """
+    Points run_id and file_name at the run to crawl and returns its {url: [items]} tasks.
+    """
+    global run_id, file_name
+    if resume is None:
+        manifest.start_run(run_id, file_name, urls, shopping_list)
+    else:
+        run_id = manifest.latest_run() if resume == "latest" else resume
+        file_name = run_id and manifest.output_file(run_id)
+        if not file_name:
+            raise SystemExit(f"No run to resume ({resume})")
+        logging.info(f"Resuming run {run_id} into {file_name}")
+    return manifest.remaining_tasks(run_id)
 
 def main():
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = [executor.submit(handle_url, url) for url in urls]
+    global max_age
+    args = parse_args()
+    if args.max_age is not None:
+        max_age = args.max_age
+    tasks = start_or_resume(args.resume)
+    with BrowserPool(size=pool_size, max_pages=max_pages_per_browser, render_profile=render_profile) as pool:
+        futures = [pool.submit(handle_url, url, pool, items) for url, items in tasks.items()]
         for future in as_completed(futures):
             try:
                 future.result()
             except Exception as e:
                 logging.error(f"Error in thread execution: {str(e)}")
+    api_client.close()
+    close_csv_writers()  # before the stage summary, so it includes the last csv.write spans
+    readiness_stats.log_summary()
+    logging.info(f"Rate limiter: {rate_limiter.summary()}")
+    if render_profile is not None:
+        render_profile.log_summary()
+    logging.info(f"Results cache: {results_cache.summary()}")
+    results_cache.close()
+    tracer.log_summary()
+    tracer.write_summary(f"{data_folder}trace_summary_{run_id}.json")
+    if trace_file:
+        tracer.export_otlp(trace_file)
 
-    process_csv(file_name)
+    manifest.finish_run(run_id)
+    manifest.close()
+    process_csv(file_name, columnar=columnar_output, engine=normalization_engine, history=price_history)
+    price_history.log_changes()
+    price_history.close()
+    run_counters.log_summary()
+    stop_logging()
 
 if __name__ == "__main__":
     main()
@@ -1,11 +1,25 @@
+import argparse
 import asyncio
 import logging
-import json
+import os
 from datetime import datetime
+from urllib.parse import urlparse
+from browser_pool import AsyncBrowserPool
+from session_manager import AsyncPageSession
 from site_logic_async import SiteLogicAsync
-from data_handler import save_json_as_csv, process_csv
+from data_handler import save_json_as_csv, close_csv_writers, process_csv
+from readiness import readiness_stats
+from logger import setup_logging, stop_logging, run_counters
+from site_adapters import adapter_for, product_identity
+from selector_cache import SelectorCache
+from session_store import SessionStore
+from rate_limiter import RateLimiter, backoff_delay
+from price_history import PriceHistory
+from tracing import tracer
+from render_profile import RenderProfile
+from api_extraction import ApiEndpoints, api_client
+from results_cache import ResultsCache, parse_max_age
 from dotenv import load_dotenv
-import agentql
 
 load_dotenv()
 
@@ -18,38 +32,216 @@ urls = [
 ]
 shopping_list = ["Corona", "Stella", "Becks", "Heineken"]
 data_folder = "D:\\ProjectsAI\\WebBuyer\\data\\"
+columnar_output = os.getenv("COLUMNAR_OUTPUT")  # "parquet", "arrow" or unset
+normalization_engine = os.getenv("NORMALIZATION_ENGINE", "rows")  # "rows" or "pandas"
+pool_size = int(os.getenv("BROWSER_POOL_SIZE", 2))
+max_pages_per_browser = int(os.getenv("BROWSER_MAX_PAGES", 50))
+max_concurrency = int(os.getenv("CRAWL_MAX_CONCURRENCY", 8))
+per_site_concurrency = int(os.getenv("CRAWL_PER_SITE_CONCURRENCY", 0))  # 0 uses each site's rate_limit
+crawl_mode = os.getenv("CRAWL_MODE", "items")  # "items" or "category" (one listing fanned out to all items)
+render_mode = os.getenv("RENDER_PROFILE", "light")  # "light" blocks images, media, fonts and trackers; "full" loads all
 
-current_date_time = datetime.now().strftime("%d.%m.%Y_%H.%M")
+current_date_time = datetime.now().strftime("%d.%m.%Y_%H.%M.%S")
 file_name = f"{data_folder}price_verification_{current_date_time}.csv"
 
-list_of_cookies = []
-with open(r"./research/carrefour.txt", "r") as file:
-    list_of_cookies = json.load(file)
+setup_logging(f"{data_folder}log_{current_date_time}.log",
+              debug_modules=os.getenv("DEBUG_MODULES", "").split(","))  # e.g. "data_handler,site_logic"
 
-logging.basicConfig(level=logging.DEBUG, filename=f"{data_folder}log_{current_date_time}.log", filemode='w',
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+selector_cache = SelectorCache(f"{data_folder}selector_cache.json")
+api_endpoints = ApiEndpoints(f"{data_folder}api_endpoints.json")
+session_store = SessionStore(f"{data_folder}sessions", max_age_hours=int(os.getenv("SESSION_MAX_AGE_HOURS", 24)))
+rate_limiter = RateLimiter()
+price_history = PriceHistory(f"{data_folder}price_history.sqlite3")
+trace_file = os.getenv("TRACE_FILE")  # optional OTLP/JSON span export path
+tracer.record_spans(bool(trace_file))
+render_profile = RenderProfile() if render_mode == "light" else None
+results_cache = ResultsCache(f"{data_folder}results_cache.sqlite3",
+                             max_bytes=int(float(os.getenv("RESULTS_CACHE_MAX_MB", 64)) * 1024 * 1024))
+max_age = parse_max_age(os.getenv("RESULTS_CACHE_MAX_AGE", "0"))  # e.g. "2h"; 0 always crawls, overridden by --max-age
+postal_code = os.getenv("POSTAL_CODE", "")
+max_attempts = 3
 
-async def handle_url(url):
-    session = await agentql.start_async_session(url)
-    site_logic = SiteLogicAsync(session, url)
-    await site_logic.set_postal_code()
-    for item in shopping_list:
+class CrawlScheduler:
+    """
+    Runs every (url, item) pair as its own task on a tab of the site's context,
+    bounded by a per-domain and a global concurrency limit.
+    """
+    def __init__(self, pool, max_concurrency, per_site_concurrency=None):
+        self.pool = pool
+        self.global_limit = asyncio.Semaphore(max_concurrency)
+        self.per_site_concurrency = per_site_concurrency
+        self.site_limits = {}
+
+    def site_limit(self, url):
+        domain = urlparse(url).netloc
+        if domain not in self.site_limits:
+            concurrency = self.per_site_concurrency or adapter_for(url).rate_limit["concurrency"]
+            self.site_limits[domain] = asyncio.Semaphore(concurrency)
+        return self.site_limits[domain]
+
+    async def run(self, urls, shopping_list):
+        await asyncio.gather(*(self.crawl_site(url, shopping_list) for url in urls))
+
+    async def crawl_site(self, url, shopping_list):
+        shopping_list = serve_cached(url, shopping_list)
+        if not shopping_list:
+            return
+        storage_state = session_store.load(url)
+        context = await self.pool.new_context(site_url=url, storage_state=storage_state)
         try:
-            search_results = await site_logic.search_item(item)
-            logging.info(f"Successfully processed {item} results at {url}")
-            save_json_as_csv(search_results, file_name, url, item)
+            if storage_state is None and adapter_for(url).setup:
+                with tracer.span("setup", url=url):
+                    setup = await AsyncPageSession.open(context, url)
+                    try:
+                        await SiteLogicAsync(setup, url, selector_cache=selector_cache).setup(session_store)
+                    finally:
+                        await setup.stop()
+            items = shopping_list
+            if crawl_mode == "category" and adapter_for(url).category:
+                items = await self.crawl_category(context, url, items)
+            await asyncio.gather(*(self.crawl_item(context, url, item) for item in items))
+        except Exception as e:
+            logging.error(f"Unexpected error setting up {url}: {str(e)}")
+        finally:
+            await context.close()
+
+    async def crawl_item(self, context, url, item):
+        with tracer.span("crawl_task", url=url, item=item):
+            async with self.site_limit(url), self.global_limit:
+                # Direct search URLs don't need the home page loaded first.
+                session = await AsyncPageSession.open(context, None if adapter_for(url).search_url_for(url, item) else url)
+                try:
+                    await self.search_with_retries(SiteLogicAsync(session, url, selector_cache=selector_cache,
+                                                                     rate_limiter=rate_limiter,
+                                                                     api_endpoints=api_endpoints), url, item)
+                finally:
+                    await session.stop()
+
+    async def with_retries(self, url, label, call):
+        """
+        Awaits call() under the domain's rate limit and returns its result,
+        retrying within the run-wide budget. Raises the last error once retries
+        are exhausted. Response times reach the limiter from SiteLogicAsync's
+        own requests.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            with tracer.span("rate_limit.wait"):
+                await rate_limiter.wait_async(url)
+            try:
+                with tracer.span("attempt", attempt=attempt):
+                    result = await call()
+            except ValueError:
+                rate_limiter.record_success()
+                raise  # No need to retry on ValueError
+            except Exception as e:
+                if not rate_limiter.should_retry(attempt, max_attempts):
+                    raise
+                delay = backoff_delay(attempt)
+                logging.warning(f"Error processing {label} at {url}: {str(e)} - Retry {attempt}/{max_attempts - 1} in {delay:.1f}s")
+                with tracer.span("retry.backoff", attempt=attempt):
+                    await asyncio.sleep(delay)
+                continue
+            rate_limiter.record_success()
+            return result
+
+    async def search_with_retries(self, site_logic, url, item):
+        try:
+            search_results = await self.with_retries(url, item, lambda: site_logic.search_item(item))
         except ValueError as ve:
             logging.error(f"ValueError processing {item} at {url}: {str(ve)}")
+            return
         except Exception as e:
-            logging.error(f"Unexpected error processing {item} at {url}: {str(e)}")
-        await asyncio.sleep(1)
-    await session.stop()
+            logging.error(f"Failed to process {item} at {url}: {str(e)}")
+            return
+        save_item_results(search_results, url, item)
+
+    async def crawl_category(self, context, url, items):
+        """
+        Extracts the site's category listing page by page on one tab and fans the
+        products out to items locally. Returns the items it found nothing for.
+        """
+        products, seen, pages = [], set(), 0
+        with tracer.span("crawl_category", url=url):
+            async with self.site_limit(url), self.global_limit:
+                session = await AsyncPageSession.open(context)
+                try:
+                    site_logic = SiteLogicAsync(session, url, selector_cache=selector_cache, rate_limiter=rate_limiter,
+                                                api_endpoints=api_endpoints)
+                    for page in range(1, site_logic.adapter.category["max_pages"] + 1):
+                        try:
+                            page_products = await self.with_retries(url, f"category page {page}",
+                                                                    lambda: site_logic.category_page(page))
+                        except Exception as e:
+                            logging.error(f"Failed to process category page {page} at {url}: {str(e)}")
+                            break
+                        new_products = [p for p in page_products if product_identity(p) not in seen]
+                        if not new_products:
+                            break
+                        seen.update(product_identity(p) for p in new_products)
+                        products.extend(new_products)
+                        pages += 1
+                finally:
+                    await session.stop()
+        logging.info(f"Category crawl at {url} found {len(products)} products in {pages} pages")
+        matches = adapter_for(url).fan_out(products, items)
+        for item, item_products in matches.items():
+            save_item_results({"results": {"products": item_products}}, url, item)
+        return [item for item in items if item not in matches]
+
+def serve_cached(url, items):
+    """
+    Saves the cached results younger than max_age for items at url and returns
+    the items that still need crawling.
+    """
+    if not max_age:
+        return items
+    remaining = []
+    for item in items:
+        cached = results_cache.get(url, item, postal_code, max_age)
+        if cached is None:
+            remaining.append(item)
+        else:
+            save_item_results(cached, url, item, from_cache=True)
+    return remaining
+
+def save_item_results(search_results, url, item, from_cache=False):
+    logging.info(f"Successfully processed {item} results at {url}" + (" from cache" if from_cache else ""))
+    if not from_cache:
+        results_cache.put(url, item, postal_code, search_results)
+    with tracer.span("save_json_as_csv", url=url, item=item):
+        save_json_as_csv(search_results, file_name, url, item)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Crawl the stores for the shopping list prices concurrently.")
+    parser.add_argument("--max-age", type=parse_max_age, metavar="AGE",
+                        help="serve items crawled within AGE (e.g. 90s, 30m, 2h) from the results cache")
+    return parser.parse_args()
 
 async def main():
-    tasks = [handle_url(url) for url in urls]
-    await asyncio.gather(*tasks)
+    async with AsyncBrowserPool(size=pool_size, max_pages=max_pages_per_browser, render_profile=render_profile) as pool:
+        await CrawlScheduler(pool, max_concurrency, per_site_concurrency).run(urls, shopping_list)
+    await api_client.aclose()
+    close_csv_writers()  # before the stage summary, so it includes the last csv.write spans
+    readiness_stats.log_summary()
+    logging.info(f"Rate limiter: {rate_limiter.summary()}")
+    if render_profile is not None:
+        render_profile.log_summary()
+    logging.info(f"Results cache: {results_cache.summary()}")
+    results_cache.close()
+    tracer.log_summary()
+    tracer.write_summary(f"{data_folder}trace_summary_{current_date_time}.json")
+    if trace_file:
+        tracer.export_otlp(trace_file)
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.max_age is not None:
+        max_age = args.max_age
     asyncio.run(main())
-
-process_csv(file_name)
+    process_csv(file_name, columnar=columnar_output, engine=normalization_engine, history=price_history)
+    price_history.log_changes()
+    price_history.close()
+    run_counters.log_summary()
+    stop_logging()
@@ -0,0 +1,241 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from columnar_sink import price_or_none
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    recorded_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS products (
+    product_id INTEGER PRIMARY KEY,
+    store TEXT NOT NULL,
+    product_key TEXT NOT NULL,
+    item TEXT,
+    product_description TEXT,
+    volume TEXT,
+    volume_value INTEGER,
+    package_type TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    product_price REAL,
+    product_discount_price REAL,
+    unit_price REAL,
+    price_per_liter REAL,
+    UNIQUE (store, product_key)
+);
+CREATE INDEX IF NOT EXISTS products_seen_item_price ON products (last_seen, item, price_per_liter);
+CREATE INDEX IF NOT EXISTS products_item ON products (item, store);
+CREATE TABLE IF NOT EXISTS price_versions (
+    product_id INTEGER NOT NULL REFERENCES products(product_id),
+    run_id TEXT NOT NULL,
+    product_price REAL,
+    product_discount_price REAL,
+    unit_price REAL,
+    price_per_liter REAL,
+    PRIMARY KEY (product_id, run_id)
+);
+CREATE INDEX IF NOT EXISTS price_versions_run ON price_versions (run_id);
+"""
+
+PRICE_COLUMNS = ("product_price", "product_discount_price", "unit_price", "price_per_liter")
+
+def run_id_for(run_timestamp):
+    """
+    Formats a run timestamp so run ids sort chronologically as text.
+    """
+    return run_timestamp.strftime("%Y-%m-%d %H:%M:%S")
+
+def product_key(description):
+    return re.sub(r"\s+", " ", description.strip().lower())
+
+def cheapest_listings(data):
+    """
+    Returns [(row, prices)] with one listing per (store, product key): the one
+    with the lowest price per liter, the first on ties, as find_lowest_price_per_type
+    picks. Rows with invalid prices have no unit price to track and are skipped.
+    """
+    cheapest = {}
+    for row in data:
+        prices = tuple(price_or_none(row.get(name)) for name in PRICE_COLUMNS)
+        if prices[2] is None:
+            continue
+        key = (row["url"], product_key(row["product_description"]))
+        kept = cheapest.get(key)
+        if kept is None or (prices[3] is not None and (kept[1][3] is None or prices[3] < kept[1][3])):
+            cheapest[key] = (row, prices)
+    return list(cheapest.values())
+
+class PriceHistory:
+    """
+    Persistent price history keyed by (store, normalized product description).
+    Each snapshot updates when a product was last seen, but a new price version
+    is stored only when its prices changed, so the database grows with price
+    changes rather than with runs.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def record_snapshot(self, data, run_timestamp):
+        """
+        Upserts the processed rows of one run and returns how many products were
+        new, changed and unchanged. A product listed more than once in the run
+        is recorded at its cheapest listing. Recording the same run again is
+        idempotent.
+        """
+        run_id = run_id_for(run_timestamp)
+        counts = {"new": 0, "changed": 0, "unchanged": 0}
+        listings = cheapest_listings(data)
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("INSERT OR IGNORE INTO runs (run_id, recorded_at) VALUES (?, ?)", (run_id, time.time()))
+            for row, prices in listings:
+                counts[self._upsert(run_id, row, prices)] += 1
+        logger.info("Recorded run %s in price history: %s", run_id, counts)
+        return counts
+
+    def latest_run(self):
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(run_id) FROM runs").fetchone()
+        return row[0]
+
+    def lowest_price_per_type(self, run_id=None):
+        """
+        Returns the lowest price per liter per item at run_id (default: the
+        latest run), from the price versions in effect then, so older runs can
+        be recorded or resumed after newer ones. Covers the products first seen
+        by and last seen from run_id, in the shape of find_lowest_price_per_type.
+        Stores tied at the lowest price are listed together in the url.
+        """
+        run_id = run_id or self.latest_run()
+        with self._lock:
+            rows = self._conn.execute("""
+                WITH listed AS (
+                    SELECT p.item, p.store, p.product_description, v.unit_price, v.price_per_liter
+                    FROM products p
+                    JOIN price_versions v
+                      ON v.product_id = p.product_id
+                     AND v.run_id = (SELECT MAX(run_id) FROM price_versions
+                                     WHERE product_id = p.product_id AND run_id <= ?)
+                    WHERE p.first_seen <= ? AND p.last_seen >= ? AND v.price_per_liter IS NOT NULL)
+                SELECT l.item, l.price_per_liter, l.product_description, l.unit_price,
+                       GROUP_CONCAT(DISTINCT l.store) AS url
+                FROM listed l
+                JOIN (SELECT item, MIN(price_per_liter) AS lowest FROM listed GROUP BY item) m
+                  ON l.item = m.item AND l.price_per_liter = m.lowest
+                GROUP BY l.item""", (run_id, run_id, run_id)).fetchall()
+        return {
+            row["item"]: {
+                "price": row["price_per_liter"],
+                "product": {
+                    "product_description": row["product_description"],
+                    "unit_price": row["unit_price"],
+                    "url": row["url"].replace(",", ", "),
+                },
+            }
+            for row in rows
+        }
+
+    def changes_since_last_run(self, run_id=None):
+        """
+        Returns the products whose prices changed in run_id (default: the latest
+        run) with their previous prices. Products first seen in run_id have None
+        as the previous price.
+        """
+        run_id = run_id or self.latest_run()
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT p.store, p.item, p.product_description,
+                       prev.unit_price AS previous_unit_price, v.unit_price,
+                       prev.price_per_liter AS previous_price_per_liter, v.price_per_liter
+                FROM price_versions v
+                JOIN products p ON p.product_id = v.product_id
+                LEFT JOIN price_versions prev
+                  ON prev.product_id = v.product_id
+                 AND prev.run_id = (SELECT MAX(run_id) FROM price_versions
+                                    WHERE product_id = v.product_id AND run_id < v.run_id)
+                WHERE v.run_id = ?
+                ORDER BY p.item, p.store, p.product_description""", (run_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def trend(self, item, store=None):
+        """
+        Returns the price versions of every product for item, optionally at one
+        store, ordered by product and run.
+        """
+        query = """
+            SELECT p.store, p.product_description, v.run_id, v.unit_price, v.price_per_liter
+            FROM products p
+            JOIN price_versions v ON v.product_id = p.product_id
+            WHERE p.item = ?"""
+        params = [item]
+        if store:
+            query += " AND p.store = ?"
+            params.append(store)
+        query += " ORDER BY p.store, p.product_description, v.run_id"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def log_changes(self, run_id=None):
+        changes = self.changes_since_last_run(run_id)
+        new = sum(1 for change in changes if change["previous_unit_price"] is None)
+        logger.info("Price changes since last run: %d changed, %d new", len(changes) - new, new)
+        for change in changes:
+            if change["previous_unit_price"] is not None:
+                logger.info("%s at %s: unit price %.2f -> %.2f", change["product_description"], change["store"],
+                            change["previous_unit_price"], change["unit_price"])
+        return changes
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _upsert(self, run_id, row, prices):
+        store, key = row["url"], product_key(row["product_description"])
+        details = (row["item"], row["product_description"], row.get("volume"), row.get("volume_value"),
+                   row.get("package_type"))
+        current = self._conn.execute(
+            "SELECT product_id, last_seen FROM products WHERE store = ? AND product_key = ?", (store, key)).fetchone()
+        if current is None:
+            cursor = self._conn.execute(
+                "INSERT INTO products (store, product_key, item, product_description, volume, volume_value, "
+                "package_type, first_seen, last_seen, product_price, product_discount_price, unit_price, "
+                "price_per_liter) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (store, key) + details + (run_id, run_id) + prices)
+            self._add_version(cursor.lastrowid, run_id, prices)
+            return "new"
+        product_id = current["product_id"]
+        if run_id >= current["last_seen"]:
+            self._conn.execute(
+                "UPDATE products SET item = ?, product_description = ?, volume = ?, volume_value = ?, "
+                "package_type = ?, last_seen = ?, product_price = ?, product_discount_price = ?, unit_price = ?, "
+                "price_per_liter = ? WHERE product_id = ?",
+                details + (run_id,) + prices + (product_id,))
+        else:
+            # Backfilling an older run: keep the current prices, only extend the history.
+            self._conn.execute("UPDATE products SET first_seen = MIN(first_seen, ?) WHERE product_id = ?",
+                               (run_id, product_id))
+        # Compare with the version in effect at this run, not with the latest one.
+        previous = self._conn.execute(
+            "SELECT product_price, product_discount_price, unit_price, price_per_liter FROM price_versions "
+            "WHERE product_id = ? AND run_id <= ? ORDER BY run_id DESC LIMIT 1", (product_id, run_id)).fetchone()
+        if previous is None or tuple(previous) != prices:
+            self._add_version(product_id, run_id, prices)
+            return "changed"
+        return "unchanged"
+
+    def _add_version(self, product_id, run_id, prices):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO price_versions (product_id, run_id, product_price, product_discount_price, "
+            "unit_price, price_per_liter) VALUES (?, ?, ?, ?, ?, ?)", (product_id, run_id) + prices)
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlparse
+from site_adapters import adapter_for
+
+logger = logging.getLogger(__name__)
+
+class RetryableStatusError(Exception):
+    """
+    Raised when a store answers 429 or 5xx, so the caller backs off and retries.
+    """
+    def __init__(self, url, status):
+        super().__init__(f"{url} answered HTTP {status}")
+        self.status = status
+
+def is_throttled(status):
+    return status is not None and (status == 429 or status >= 500)
+
+class DomainLimiter:
+    """
+    Token bucket for one domain whose rate adapts AIMD-style: it grows additively
+    while responses are fast and halves on slow responses, 429 or 5xx.
+    """
+    def __init__(self, domain, requests_per_second=0.5, min_requests_per_second=0.05,
+                 max_requests_per_second=2.0, increase=0.05, slow_seconds=8.0, burst=1):
+        self.domain = domain
+        self.rate = requests_per_second
+        self.min_rate = min_requests_per_second
+        self.max_rate = max_requests_per_second
+        self.increase = increase
+        self.slow_seconds = slow_seconds
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token and returns how long the caller must wait before using it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def record(self, latency, status=None):
+        with self._lock:
+            if is_throttled(status) or latency > self.slow_seconds:
+                self.rate = max(self.min_rate, self.rate / 2)
+                logger.info("Slowing %s to %.3f req/s (status=%s, latency=%.2fs)", self.domain, self.rate, status, latency)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+class RetryBudget:
+    """
+    Run-wide retry allowance: every success earns ratio of a retry, and every
+    retry spends one, on top of an initial minimum. Keeps failing stores from
+    multiplying load.
+    """
+    def __init__(self, ratio=0.2, minimum=10, cap=100):
+        self.ratio = ratio
+        self.cap = cap
+        self.tokens = float(minimum)
+        self.retries = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def record_success(self):
+        with self._lock:
+            self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def try_acquire(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.retries += 1
+                return True
+            self.denied += 1
+            return False
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """
+    Full-jitter exponential backoff for the given retry attempt (1-based).
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class RateLimiter:
+    """
+    Per-domain adaptive limiters configured from each site's rate_limit, plus
+    the shared retry budget.
+    """
+    def __init__(self, retry_budget=None):
+        self.retry_budget = retry_budget or RetryBudget()
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url):
+        domain = urlparse(url).netloc
+        with self._lock:
+            if domain not in self._limiters:
+                settings = {k: v for k, v in adapter_for(url).rate_limit.items() if k != "concurrency"}
+                self._limiters[domain] = DomainLimiter(domain, **settings)
+            return self._limiters[domain]
+
+    def wait(self, url):
+        delay = self.for_url(url).reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def wait_async(self, url):
+        delay = self.for_url(url).reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def record(self, url, latency, status=None):
+        """
+        Feeds one HTTP response time and status to the domain's limiter.
+        """
+        self.for_url(url).record(latency, status)
+
+    def record_success(self):
+        self.retry_budget.record_success()
+
+    def should_retry(self, attempt, max_attempts):
+        return attempt < max_attempts and self.retry_budget.try_acquire()
+
+    def summary(self):
+        with self._lock:
+            rates = {domain: round(limiter.rate, 3) for domain, limiter in self._limiters.items()}
+        return {"rates": rates, "retries": self.retry_budget.retries, "retries_denied": self.retry_budget.denied}
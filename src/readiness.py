@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET = 10.0
+DEFAULT_QUIET_MS = 300
+DEFAULT_SCROLL_TIMEOUT = 2.0
+
+# Resolves as soon as the product selector matches, or once the document is
+# loaded and neither the DOM nor the network has changed for quietMs.
+READY_SCRIPT = """
+({ selector, quietMs, token }) => {
+    if (!window.__webBuyerReady) {
+        window.__webBuyerReady = { lastMutation: performance.now(), token: token };
+        new MutationObserver(() => {
+            window.__webBuyerReady.lastMutation = performance.now();
+        }).observe(document, { childList: true, subtree: true, attributes: true });
+    }
+    if (window.__webBuyerReady.token !== token) {
+        // New wait on an already observed document: the quiet period starts now.
+        Object.assign(window.__webBuyerReady, { lastMutation: performance.now(), token: token });
+    }
+    if (selector && document.querySelector(selector)) {
+        return "selector";
+    }
+    const now = performance.now();
+    const resources = performance.getEntriesByType("resource");
+    const lastResponse = resources.length ? resources[resources.length - 1].responseEnd : 0;
+    if (document.readyState === "complete"
+            && now - window.__webBuyerReady.lastMutation >= quietMs
+            && now - lastResponse >= quietMs) {
+        return "idle";
+    }
+    return false;
+}
+"""
+
+# Scrolls to the bottom and returns the height before scrolling, so a wait on
+# GREW_SCRIPT can tell whether lazy loading appended anything.
+SCROLL_SCRIPT = "() => { const height = document.body.scrollHeight; window.scrollTo(0, height); return height; }"
+GREW_SCRIPT = "height => document.body.scrollHeight > height"
+
+class ReadinessStats:
+    """
+    Thread-safe accumulator of time spent waiting for pages, per site.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waits = defaultdict(list)
+        self._timeouts = defaultdict(int)
+
+    def record(self, url, seconds, signal):
+        with self._lock:
+            self._waits[url].append(seconds)
+            if signal == "timeout":
+                self._timeouts[url] += 1
+
+    def summary(self):
+        with self._lock:
+            return {
+                url: {
+                    "waits": len(waits),
+                    "total_seconds": round(sum(waits), 3),
+                    "mean_seconds": round(sum(waits) / len(waits), 3),
+                    "max_seconds": round(max(waits), 3),
+                    "timeouts": self._timeouts[url],
+                }
+                for url, waits in self._waits.items()
+            }
+
+    def log_summary(self):
+        for url, stats in self.summary().items():
+            logger.info("Readiness waits at %s: %s", url, stats)
+
+readiness_stats = ReadinessStats()
+
+def wait_until_ready(page, url, selector=None, budget=DEFAULT_BUDGET, quiet_ms=DEFAULT_QUIET_MS):
+    """
+    Waits until the page is ready or the budget (seconds) runs out.
+    Returns the seconds spent waiting.
+    """
+    start = time.perf_counter()
+    try:
+        handle = page.wait_for_function(READY_SCRIPT, arg={"selector": selector, "quietMs": quiet_ms, "token": start},
+                                        timeout=budget * 1000, polling=100)
+        signal = handle.json_value()
+    except PlaywrightTimeoutError:
+        signal = "timeout"
+    elapsed = time.perf_counter() - start
+    readiness_stats.record(url, elapsed, signal)
+    logger.debug("Page ready at %s in %.3fs (%s)", url, elapsed, signal)
+    return elapsed
+
+async def wait_until_ready_async(page, url, selector=None, budget=DEFAULT_BUDGET, quiet_ms=DEFAULT_QUIET_MS):
+    """
+    Async variant of wait_until_ready.
+    """
+    start = time.perf_counter()
+    try:
+        handle = await page.wait_for_function(READY_SCRIPT, arg={"selector": selector, "quietMs": quiet_ms, "token": start},
+                                              timeout=budget * 1000, polling=100)
+        signal = await handle.json_value()
+    except PlaywrightTimeoutError:
+        signal = "timeout"
+    elapsed = time.perf_counter() - start
+    readiness_stats.record(url, elapsed, signal)
+    logger.debug("Page ready at %s in %.3fs (%s)", url, elapsed, signal)
+    return elapsed
+
+def scroll_until_loaded(page, steps, timeout=DEFAULT_SCROLL_TIMEOUT):
+    """
+    Scrolls a lazy-loading page to the bottom up to steps times, stopping as
+    soon as a scroll loads nothing within timeout seconds. Returns the number
+    of scrolls that loaded more content.
+    """
+    loaded = 0
+    for _ in range(steps):
+        height = page.evaluate(SCROLL_SCRIPT)
+        try:
+            page.wait_for_function(GREW_SCRIPT, arg=height, timeout=timeout * 1000, polling=100)
+        except PlaywrightTimeoutError:
+            break
+        loaded += 1
+    return loaded
+
+async def scroll_until_loaded_async(page, steps, timeout=DEFAULT_SCROLL_TIMEOUT):
+    """
+    Async variant of scroll_until_loaded.
+    """
+    loaded = 0
+    for _ in range(steps):
+        height = await page.evaluate(SCROLL_SCRIPT)
+        try:
+            await page.wait_for_function(GREW_SCRIPT, arg=height, timeout=timeout * 1000, polling=100)
+        except PlaywrightTimeoutError:
+            break
+        loaded += 1
+    return loaded
@@ -0,0 +1,118 @@
+import logging
+import threading
+from collections import defaultdict
+from fnmatch import fnmatch
+from urllib.parse import urlparse
+from site_adapters import adapter_for
+
+logger = logging.getLogger(__name__)
+
+# Typical transfer sizes per resource type. Aborted requests are never
+# fetched, so the bytes they would have cost can only be estimated.
+ESTIMATED_BYTES = {
+    "image": 35_000,
+    "media": 400_000,
+    "font": 40_000,
+    "script": 60_000,
+    "stylesheet": 25_000,
+    "xhr": 5_000,
+    "fetch": 5_000,
+}
+DEFAULT_ESTIMATED_BYTES = 10_000
+
+class RenderStats:
+    """
+    Thread-safe count of requests let through and blocked per site, with an
+    estimate of the bytes blocking saved.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._allowed = defaultdict(int)
+        self._blocked = defaultdict(lambda: defaultdict(int))
+
+    def record(self, host, resource_type, blocked):
+        with self._lock:
+            if blocked:
+                self._blocked[host][resource_type] += 1
+            else:
+                self._allowed[host] += 1
+
+    def summary(self):
+        with self._lock:
+            hosts = sorted(set(self._allowed) | set(self._blocked))
+            return {
+                host: {
+                    "allowed": self._allowed[host],
+                    "blocked": sum(self._blocked[host].values()),
+                    "blocked_by_type": dict(sorted(self._blocked[host].items())),
+                    "estimated_bytes_saved": sum(ESTIMATED_BYTES.get(resource_type, DEFAULT_ESTIMATED_BYTES) * count
+                                                 for resource_type, count in self._blocked[host].items()),
+                }
+                for host in hosts
+            }
+
+class RenderProfile:
+    """
+    Lightweight rendering for scraping contexts: requests for the resource
+    types and URL patterns in the site's "render" config (images, media,
+    fonts, trackers) are aborted before they are sent, unless they match the
+    site's allow-list. The browser pools apply it to every context they create.
+    """
+    def __init__(self):
+        self.stats = RenderStats()
+
+    def context_options(self):
+        # Requests served by a service worker bypass routing, so they would escape the blocking.
+        return {"service_workers": "block"}
+
+    def blocks(self, render, request_url, resource_type):
+        """
+        Returns True if the request should be aborted under the site's render config.
+        """
+        if any(fnmatch(request_url, pattern) for pattern in render["allow"]):
+            return False
+        return (resource_type in render["block_resource_types"]
+                or any(fnmatch(request_url, pattern) for pattern in render["block_patterns"]))
+
+    def apply(self, context, site_url=None):
+        """
+        Routes every request of context through the site's blocking rules.
+        """
+        render = adapter_for(site_url or "").render
+        host = urlparse(site_url or "").netloc
+
+        def handle(route, request):
+            blocked = self.blocks(render, request.url, request.resource_type)
+            self.stats.record(host, request.resource_type, blocked)
+            if blocked:
+                route.abort("blockedbyclient")
+            else:
+                route.continue_()
+
+        context.route("**/*", handle)
+
+    async def apply_async(self, context, site_url=None):
+        """
+        Async variant of apply.
+        """
+        render = adapter_for(site_url or "").render
+        host = urlparse(site_url or "").netloc
+
+        async def handle(route, request):
+            blocked = self.blocks(render, request.url, request.resource_type)
+            self.stats.record(host, request.resource_type, blocked)
+            if blocked:
+                await route.abort("blockedbyclient")
+            else:
+                await route.continue_()
+
+        await context.route("**/*", handle)
+
+    def summary(self):
+        return self.stats.summary()
+
+    def log_summary(self):
+        for host, stats in self.summary().items():
+            logger.info("Render profile at %s: %d requests allowed, %d blocked %s, ~%.1f MB saved", host,
+                        stats["allowed"], stats["blocked"], stats["blocked_by_type"],
+                        stats["estimated_bytes_saved"] / 1_000_000)
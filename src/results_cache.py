@@ -0,0 +1,119 @@
+import argparse
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    site TEXT NOT NULL,
+    item TEXT NOT NULL,
+    postal_code TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (site, item, postal_code)
+);
+CREATE INDEX IF NOT EXISTS results_used_at ON results (used_at);
+"""
+
+AGE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def parse_max_age(value):
+    """
+    Parses an age such as "90s", "30m", "2h" or "1d" into seconds. Bare numbers are minutes.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", str(value).lower())
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid age: {value!r} (use e.g. 90s, 30m, 2h or 1d)")
+    return float(match.group(1)) * AGE_UNITS[match.group(2) or "m"]
+
+class ResultsCache:
+    """
+    Search results of earlier runs keyed by (site, item, postal code), so a
+    re-run within max_age saves them without driving the store again. Entries
+    older than a run's max_age are kept for runs that accept older results;
+    the payloads are bounded to max_bytes by evicting the least recently used.
+    """
+    def __init__(self, path, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        # Read and written from the browser workers.
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def get(self, url, item, postal_code, max_age):
+        """
+        Returns the cached search results for item at url if stored less than
+        max_age seconds ago, otherwise None.
+        """
+        key = self._key(url, item, postal_code)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT payload, stored_at FROM results WHERE site = ? AND item = ? AND postal_code = ?",
+                                     key).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if now - row[1] > max_age:
+                self.stale += 1
+                return None
+            self._conn.execute("UPDATE results SET used_at = ? WHERE site = ? AND item = ? AND postal_code = ?",
+                               (now, *key))
+            self.hits += 1
+        logger.debug("Serving %s at %s from cache (%.0fs old)", item, url, now - row[1])
+        return json.loads(row[0])
+
+    def put(self, url, item, postal_code, search_results):
+        """
+        Stores the search results for item at url, evicting the least recently
+        used entries beyond max_bytes.
+        """
+        payload = json.dumps(search_results, ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("INSERT OR REPLACE INTO results (site, item, postal_code, payload, size, stored_at, used_at) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?)", (*self._key(url, item, postal_code), payload, size, now, now))
+            self._evict()
+
+    def summary(self):
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+            return {"hits": self.hits, "misses": self.misses, "stale": self.stale, "evicted": self.evicted,
+                    "entries": entries, "bytes": total}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for site, item, postal_code, size in self._conn.execute(
+                "SELECT site, item, postal_code, size FROM results ORDER BY used_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            victims.append((site, item, postal_code))
+            total -= size
+        self._conn.executemany("DELETE FROM results WHERE site = ? AND item = ? AND postal_code = ?", victims)
+        self.evicted += len(victims)
+        logger.debug("Evicted %d cached results", len(victims))
+
+    def _key(self, url, item, postal_code):
+        return urlparse(url).netloc, item.strip().lower(), postal_code or ""
@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from urllib.parse import urlparse, parse_qsl
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_FIELDS = ["product_link", "product_description", "product_price", "product_discount_price"]
+
+# Given, per product, the elements AgentQL picked for each field, derives one
+# CSS selector matching every product card plus a selector per field relative
+# to its card. Returns null when no selector reproduces the AgentQL answer.
+LEARN_SCRIPT = """
+(products) => {
+    const usable = (cls) => !/\\d{3,}/.test(cls);
+    const step = (els) => {
+        if (!els.length || els.some(e => e.tagName !== els[0].tagName)) return null;
+        const shared = Array.from(els[0].classList).filter(c => usable(c) && els.every(e => e.classList.contains(c)));
+        return els[0].tagName.toLowerCase() + shared.map(c => "." + CSS.escape(c)).join("");
+    };
+    const commonAncestor = (els) => {
+        let node = els[0];
+        while (node && !els.every(e => node.contains(e))) node = node.parentElement;
+        return node;
+    };
+    const cards = products.map(p => commonAncestor(Object.values(p).filter(Boolean)));
+    if (cards.some(c => !c) || new Set(cards).size !== cards.length) return null;
+
+    let cardSelector = step(cards);
+    let ancestors = cards;
+    for (let depth = 0; cardSelector && depth < 5; depth++) {
+        if (document.querySelectorAll(cardSelector).length <= cards.length * 3) break;
+        ancestors = ancestors.map(a => a.parentElement);
+        if (ancestors.some(a => !a)) return null;
+        const ancestorStep = step(ancestors);
+        cardSelector = ancestorStep ? ancestorStep + " " + cardSelector : null;
+    }
+    if (!cardSelector) return null;
+    const matched = Array.from(document.querySelectorAll(cardSelector));
+    if (!cards.every(c => matched.includes(c))) return null;
+
+    const fields = {};
+    for (const field of Object.keys(products[0])) {
+        const pairs = products.map((p, i) => [cards[i], p[field]]).filter(([, el]) => el);
+        if (!pairs.length) continue;
+        const reproduces = (sel) => pairs.every(([card, el]) => card.querySelector(sel) === el);
+        let selector = step(pairs.map(([, el]) => el));
+        if (!selector || !reproduces(selector)) {
+            const chains = pairs.map(([card, el]) => {
+                const chain = [];
+                for (let node = el; node && node !== card; node = node.parentElement) chain.unshift(node);
+                return chain;
+            });
+            if (chains.some(c => c.length !== chains[0].length)) return null;
+            const steps = chains[0].map((_, i) => step(chains.map(c => c[i])));
+            if (steps.some(s => !s)) return null;
+            selector = ":scope > " + steps.join(" > ");
+            if (!reproduces(selector)) return null;
+        }
+        fields[field] = selector;
+    }
+    return { products: cardSelector, fields: fields };
+}
+"""
+
+EXTRACT_SCRIPT = """
+({ products, fields }) => Array.from(document.querySelectorAll(products)).map(card => {
+    const product = {};
+    for (const [field, selector] of Object.entries(fields)) {
+        const el = card.querySelector(selector);
+        product[field] = el ? el.innerText.trim() : null;
+    }
+    return product;
+})
+"""
+
+def page_template(url):
+    """
+    Returns the cache key for the layout of url: host, path and sorted query parameter names.
+    """
+    parsed = urlparse(url)
+    params = sorted({name for name, _ in parse_qsl(parsed.query)})
+    return f"{parsed.netloc}{parsed.path}?{','.join(params)}"
+
+class SelectorCache:
+    """
+    Concrete product selectors learned from AgentQL answers, keyed by page template
+    and persisted to a JSON file between runs.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                self.entries = json.load(file)
+            logger.info("Loaded %d cached selector sets from %s", len(self.entries), path)
+
+    def products_selector(self, url):
+        """
+        Returns a learned product card selector for the site at url, if any.
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            for key, entry in self.entries.items():
+                if key.startswith(host + "/"):
+                    return entry["products"]
+        return None
+
+    def extract(self, page, page_url):
+        """
+        Extracts the product list with the cached selectors. Returns None on a miss.
+        """
+        entry = self._entry(page_url)
+        if entry is None:
+            return None
+        return self._validated(page_url, page.evaluate(EXTRACT_SCRIPT, entry))
+
+    async def extract_async(self, page, page_url):
+        entry = self._entry(page_url)
+        if entry is None:
+            return None
+        return self._validated(page_url, await page.evaluate(EXTRACT_SCRIPT, entry))
+
+    def learn(self, page, page_url, products):
+        """
+        Records the selectors behind the products[] of an AgentQL search answer.
+        """
+        products = [
+            {field: self._handle(getattr(product, field, None)) for field in PRODUCT_FIELDS}
+            for product in products
+        ]
+        if not products:
+            return
+        self._store(page_url, page.evaluate(LEARN_SCRIPT, products))
+
+    async def learn_async(self, page, page_url, products):
+        handles = []
+        for product in products:
+            fields = {}
+            for field in PRODUCT_FIELDS:
+                locator = getattr(product, field, None)
+                fields[field] = await locator.element_handle() if locator is not None else None
+            handles.append(fields)
+        if not handles:
+            return
+        self._store(page_url, await page.evaluate(LEARN_SCRIPT, handles))
+
+    def invalidate(self, page_url):
+        key = page_template(page_url)
+        with self._lock:
+            if self.entries.pop(key, None) is not None:
+                logger.info("Invalidated cached selectors for %s", key)
+                self._save()
+
+    def _handle(self, locator):
+        return locator.element_handle() if locator is not None else None
+
+    def _entry(self, page_url):
+        with self._lock:
+            entry = self.entries.get(page_template(page_url))
+        if entry is None:
+            return None
+        return {"products": entry["products"], "fields": entry["fields"]}
+
+    def _validated(self, page_url, products):
+        if not products:
+            return None
+        valid = [p for p in products if p.get("product_description") and p.get("product_price")]
+        if not valid or len(valid) < len(products) / 2:
+            logger.warning("Cached selectors missed at %s (%d/%d valid products)", page_url, len(valid), len(products))
+            self.invalidate(page_url)
+            return None
+        logger.debug("Extracted %d products at %s with cached selectors", len(valid), page_url)
+        return valid
+
+    def _store(self, page_url, selectors):
+        key = page_template(page_url)
+        if not selectors or "product_description" not in selectors["fields"] or "product_price" not in selectors["fields"]:
+            logger.debug("Could not learn selectors for %s", key)
+            return
+        selectors["learned_at"] = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            self.entries[key] = selectors
+            self._save()
+        logger.info("Learned selectors for %s: %s", key, selectors["products"])
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file, indent=2)
+        os.replace(tmp_path, self.path)
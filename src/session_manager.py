@@ -1,11 +1,64 @@
 import agentql
-from agentql.ext.playwright import PlaywrightWebDriverSync
+from tracing import tracer, traced
+
+class PageSession:
+    """
+    AgentQL session backed by a context leased from a BrowserPool.
+    """
+    def __init__(self, context, url, restored=False):
+        self.context = context
+        self.restored = restored
+        self.current_page = agentql.wrap(context.new_page())
+        self.current_page.goto(url)
+
+    def query(self, query):
+        return self.current_page.query_elements(query)
+
+    def get_user_auth_session(self):
+        return self.context.storage_state()
+
+    def stop(self):
+        self.context.close()
+
+class AsyncPageSession:
+    """
+    Async AgentQL session on one tab of a context leased from an AsyncBrowserPool.
+    The context is owned by the caller, so stop() only closes the tab.
+    """
+    def __init__(self, page):
+        self.current_page = page
+
+    @classmethod
+    @traced("session.start")
+    async def open(cls, context, url=None):
+        page = await agentql.wrap_async(await context.new_page())
+        if url is not None:
+            await page.goto(url)
+        return cls(page)
+
+    async def query(self, query):
+        return await self.current_page.query_elements(query)
+
+    async def sibling(self):
+        """
+        Opens another session on a new tab of the same context, sharing its cookies.
+        """
+        return await AsyncPageSession.open(self.current_page.context)
+
+    @traced("session.stop")
+    async def stop(self):
+        await self.current_page.close()
 
 class SessionManager:
-    def __init__(self, url):
+    """
+    Opens a PageSession for url on a context leased from pool.
+    """
+    def __init__(self, url, pool, storage_state=None):
         self.url = url
-        self.driver = PlaywrightWebDriverSync(headless=False)
-        self.session = agentql.start_session(url, web_driver=self.driver)
-    
+        with tracer.span("session.start", url=url, restored=storage_state is not None):
+            context = pool.new_context(site_url=url, storage_state=storage_state)
+            self.session = PageSession(context, url, restored=storage_state is not None)
+
     def stop(self):
-        self.session.stop()
+        with tracer.span("session.stop", url=self.url):
+            self.session.stop()
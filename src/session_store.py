@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+class SessionStore:
+    """
+    Per-site browser storage state (cookies and localStorage) saved after a
+    successful setup, so later runs can inject it into new contexts and skip
+    the postal-code or login flow until it expires.
+    """
+    def __init__(self, folder, max_age_hours=24):
+        self.folder = folder
+        self.max_age = max_age_hours * 3600
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def path_for(self, url):
+        return os.path.join(self.folder, f"{urlparse(url).netloc}.json")
+
+    def load(self, url):
+        """
+        Returns the saved storage state for url, or None if missing or expired.
+        """
+        path = self.path_for(url)
+        with self._lock:
+            if not os.path.exists(path):
+                return None
+            with open(path, "r", encoding="utf-8") as file:
+                record = json.load(file)
+        expired_reason = self.expired_reason(record)
+        if expired_reason:
+            logger.info("Saved session for %s expired (%s)", url, expired_reason)
+            self.invalidate(url)
+            return None
+        logger.info("Reusing saved session for %s", url)
+        return record["storage_state"]
+
+    def save(self, url, storage_state, setup_cookies=()):
+        """
+        Saves storage_state for url. setup_cookies names the cookies the setup flow
+        created; the session counts as expired as soon as one of them does.
+        """
+        record = {
+            "saved_at": time.time(),
+            "setup_cookies": sorted(setup_cookies),
+            "storage_state": storage_state,
+        }
+        path = self.path_for(url)
+        with self._lock:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(record, file)
+            os.replace(tmp_path, path)
+        logger.info("Saved session for %s (%d setup cookies)", url, len(record["setup_cookies"]))
+
+    def invalidate(self, url):
+        path = self.path_for(url)
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def expired_reason(self, record):
+        now = time.time()
+        if now - record["saved_at"] > self.max_age:
+            return "older than max age"
+        setup_cookies = set(record["setup_cookies"])
+        for cookie in record["storage_state"].get("cookies", []):
+            if cookie["name"] in setup_cookies and 0 < cookie.get("expires", -1) < now:
+                return f"cookie {cookie['name']} expired"
+        return None
+
+def changed_cookies(before, after):
+    """
+    Returns the names of cookies added or changed between two context.cookies() snapshots.
+    """
+    previous = {(c["name"], c["domain"]): c["value"] for c in before}
+    return {c["name"] for c in after if previous.get((c["name"], c["domain"])) != c["value"]}
@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import re
+import unicodedata
+from fnmatch import fnmatch
+from urllib.parse import urlparse, quote_plus
+
+logger = logging.getLogger(__name__)
+
+SITES_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sites.json")
+APOSTROPHES = re.compile(r"['\u2018\u2019\u00b4`]")
+
+class SiteAdapter:
+    """
+    Everything site-specific about a store, as declared in sites.json: setup
+    steps, AgentQL queries, search-URL, page-URL and category-URL templates,
+    rate limits, render profile rules and extraction strategy. The SiteLogic
+    engines run it without branching on the URL.
+    """
+    def __init__(self, host_pattern, config, queries):
+        self.host_pattern = host_pattern
+        self.config = config
+        self.queries = queries
+        self.setup = config["setup"]
+        self.home_query = config["home_query"]
+        self.search_box = config["search_box"]
+        self.search_query = config["search_query"]
+        self.products = config["products"]
+        self.search_url = config["search_url"]
+        self.ready_budget = config["ready_budget"]
+        self.rate_limit = config["rate_limit"]
+        self.extraction = config["extraction"]
+        self.filter_by_item = config["filter_by_item"]
+        self.category = config["category"]
+        self.pagination = config["pagination"]
+        self.render = config["render"]
+
+    def query(self, name):
+        return self.queries[name]
+
+    def search_url_for(self, url, item):
+        """
+        Returns the results-page URL for item, or None when the site has no template.
+        """
+        if not self.search_url:
+            return None
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}" + self.search_url.format(query=quote_plus(item))
+
+    def page_url_for(self, url, item, page):
+        """
+        Returns the URL of results page (1-based) for item, or None when the
+        site exposes no page URLs.
+        """
+        if not self.pagination["page_url"]:
+            return None
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}" + self.pagination["page_url"].format(query=quote_plus(item), page=page)
+
+    def category_url_for(self, url, page):
+        """
+        Returns the URL of page (1-based) of the site's category listing, or None
+        when the site has no category crawl configured.
+        """
+        if not self.category:
+            return None
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}" + self.category["url"].format(page=page)
+
+    def products_of(self, data):
+        """
+        Returns the product list from a search query's to_data() payload.
+        """
+        for key in self.products.split("."):
+            data = (data or {}).get(key)
+        return data or []
+
+    def matching_products(self, products, item):
+        if not self.filter_by_item:
+            return products
+        key = match_key(item)
+        return [p for p in products if key in match_key(p.get("product_description") or "")]
+
+    def fan_out(self, products, items):
+        """
+        Matches a category listing against every item locally. Returns {item: products}
+        for the items with at least one match.
+        """
+        matches = {item: self.matching_products(products, item) for item in items}
+        return {item: found for item, found in matches.items() if found}
+
+def match_key(text):
+    """
+    Folds case, accents and apostrophes, so "Becks" matches "Beck's" and
+    "cerveja" matches "CERVEJA".
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(APOSTROPHES.sub("", text).casefold().split())
+
+def product_identity(product):
+    """
+    Identifies a listed product, to spot pages that repeat earlier ones.
+    """
+    return (product.get("product_description"), product.get("product_price"), product.get("product_discount_price"))
+
+def new_products(products, seen):
+    """
+    Returns the products whose identity is not in seen, adding them to it.
+    """
+    found = [p for p in products if product_identity(p) not in seen]
+    seen.update(product_identity(p) for p in found)
+    return found
+
+def resolve_field(response, path):
+    """
+    Follows a dotted field path ("header.search_box") on an AgentQL response.
+    """
+    for name in path.split("."):
+        response = getattr(response, name)
+    return response
+
+def action_value(value):
+    """
+    Expands "$NAME" setup values from the environment.
+    """
+    if isinstance(value, str) and value.startswith("$"):
+        return os.getenv(value[1:], "")
+    return value
+
+class SiteRegistry:
+    """
+    Loads the site adapters from config and resolves the one for a URL.
+    """
+    def __init__(self, path=SITES_CONFIG):
+        with open(path, "r", encoding="utf-8") as file:
+            config = json.load(file)
+        self.queries = {name: "\n".join(lines) for name, lines in config["queries"].items()}
+        self.defaults = config["defaults"]
+        self.adapters = [self._adapter(pattern, overrides) for pattern, overrides in config["sites"].items()]
+        self.fallback = self._adapter("*", {})
+
+    def register(self, host_pattern, overrides):
+        """
+        Adds or replaces a site adapter at runtime, ahead of the configured ones.
+        """
+        self.adapters = [a for a in self.adapters if a.host_pattern != host_pattern]
+        self.adapters.insert(0, self._adapter(host_pattern, overrides))
+
+    def adapter_for(self, url):
+        host = urlparse(url).netloc
+        for adapter in self.adapters:
+            if fnmatch(host, adapter.host_pattern):
+                return adapter
+        logger.debug("No adapter configured for %s, using defaults", host)
+        return self.fallback
+
+    def _adapter(self, host_pattern, overrides):
+        config = {**self.defaults, **overrides}
+        for section in ("rate_limit", "pagination", "render"):
+            config[section] = {**self.defaults[section], **overrides.get(section, {})}
+        unknown = [step["query"] for step in config["setup"] if step["query"] not in self.queries]
+        if unknown:
+            raise ValueError(f"Site {host_pattern} uses undefined queries: {unknown}")
+        return SiteAdapter(host_pattern, config, self.queries)
+
+registry = SiteRegistry()
+
+def adapter_for(url):
+    return registry.adapter_for(url)
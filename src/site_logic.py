@@ -1,69 +1,329 @@
-import time
 import logging
-import os
+import time
 from dotenv import load_dotenv
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+from readiness import wait_until_ready, scroll_until_loaded
+from rate_limiter import RetryableStatusError, is_throttled
+from session_store import changed_cookies
+from site_adapters import adapter_for, resolve_field, action_value, new_products
+from api_extraction import api_client, find_products, map_products, endpoint_url
+from tracing import tracer, traced
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-LOCATE_QUERY = """
-{
-    cep_btn
-    cep_text_box
-}
-"""
-
-HOME_QUERY = """
-{
-    header {
-        search_box
-    }
-}
-"""
-
-SEARCH_QUERY = """
-{
-    results {
-        products[] {
-            product_link
-            product_description
-            product_price
-            product_discount_price
-        }
-    }
-}
-"""
+load_dotenv()
 
 class SiteLogic:
-    def __init__(self, session, url):
+    def __init__(self, session, url, adapter=None, ready_selector=None, ready_budget=None, selector_cache=None,
+                 rate_limiter=None, api_endpoints=None):
         self.session = session
         self.url = url
+        self.adapter = adapter or adapter_for(url)
+        # The api strategy falls back to the DOM, through the selector cache.
+        self.selector_cache = selector_cache if self.adapter.extraction in ("selector_cache", "api") else None
+        self.api_endpoints = api_endpoints if self.adapter.extraction == "api" else None
+        self.captured = []
+        self.capture_item = None
+        self._capturing = False
+        if ready_selector is None and self.selector_cache is not None:
+            ready_selector = self.selector_cache.products_selector(url)
+        self.ready_selector = ready_selector
+        self.ready_budget = ready_budget or self.adapter.ready_budget
+        # Paces the extra requests of pagination; the first page is paced by the caller.
+        self.rate_limiter = rate_limiter
+        self.last_status = None
+
+    @traced("wait_until_ready")
+    def wait_until_ready(self, budget=None):
+        return wait_until_ready(self.session.current_page, self.url, self.ready_selector,
+                                budget or self.ready_budget)
+
+    @traced("load_more")
+    def load_more(self):
+        """
+        Scrolls lazy-loaded results into the page, within the site's scroll budget.
+        """
+        steps = self.adapter.pagination["scroll_steps"]
+        return scroll_until_loaded(self.session.current_page, steps) if steps else 0
 
+    @traced("set_postal_code")
     def set_postal_code(self):
-        postal_code = os.getenv("POSTAL_CODE")
-        if self.url == "https://mercado.carrefour.com.br/":
-            cep_data = self.session.query(LOCATE_QUERY)
-            cep_data.cep_btn.click(force=True)
-            cep_set = self.session.query(LOCATE_QUERY)
-            cep_set.cep_text_box.fill(postal_code)
-            cep_set.cep_btn.click(force=True)
+        """
+        Runs the site's declared setup steps (postal code, login). Returns True if any setup was done.
+        """
+        for step in self.adapter.setup:
+            response = self.run_query(step["query"])
+            for action in step["actions"]:
+                if "fill" in action:
+                    resolve_field(response, action["fill"]).fill(action_value(action["value"]))
+                if "press" in action:
+                    resolve_field(response, action["press"]).press(action["key"])
+                if "click" in action:
+                    resolve_field(response, action["click"]).click(force=action.get("force", False))
+        if not self.adapter.setup:
+            return False
+        self.wait_until_ready()
+        return True
+
+    def setup(self, session_store):
+        """
+        Restores the site's saved session, or runs set_postal_code and saves the
+        resulting cookies and localStorage for later runs.
+        """
+        if not hasattr(self.session, "context"):
+            self.set_postal_code()
+            return
+        if self.session.restored:
+            return
+        context = self.session.context
+        before = context.cookies()
+        if self.set_postal_code():
+            session_store.save(self.url, context.storage_state(), changed_cookies(before, context.cookies()))
     
     def querying(self, query_name):
-        logging.debug(f"querying - {query_name}")
-
-    def search_item(self, item, max_retries=3):
-        home_page = self.session.query(HOME_QUERY)
-        home_page.header.search_box.fill(item)
-        home_page.header.search_box.press("Enter")
-        time.sleep(2)
-        
-        retries = 0
-        while retries < max_retries:
-            search_results = self.session.query(SEARCH_QUERY)
-            if search_results.results.products:
-                return search_results.to_data()
-            retries += 1
-            logging.warning(f"No products found for {item} at {self.url}. Retrying {retries}/{max_retries}.")
-            time.sleep(1)
-        
-        raise ValueError(f"No products found for {item} at {self.url} after {max_retries} retries.")
+        logger.debug("querying - %s", query_name)
+
+    def run_query(self, query_name):
+        self.querying(query_name)
+        with tracer.span("agentql.query", query=query_name):
+            return self.session.query(self.adapter.query(query_name))
+
+    def navigate(self, page_url):
+        """
+        Loads page_url, recording its status and response time. Raises RetryableStatusError on 429 or 5xx.
+        """
+        logger.debug("Navigating directly to %s", page_url)
+        start = time.perf_counter()
+        try:
+            response = self.session.current_page.goto(page_url)
+        except Exception:
+            self.record_response(start)
+            raise
+        self.last_status = response.status if response is not None else None
+        self.record_response(start)
+        if is_throttled(self.last_status):
+            raise RetryableStatusError(page_url, self.last_status)
+
+    def record_response(self, start):
+        """
+        Feeds the time since start and the last status to the domain's rate
+        limiter, so it adapts to server responses rather than to extraction.
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.record(self.url, time.perf_counter() - start, self.last_status)
+
+    @traced("open_results")
+    def open_results(self, item, direct=True):
+        """
+        Opens the results page for item, by URL when the site has a search template,
+        otherwise through the search box. Returns True if the URL was used.
+        """
+        search_url = self.adapter.search_url_for(self.url, item) if direct else None
+        self.last_status = None
+        self.start_capture(item)
+        if search_url:
+            self.navigate(search_url)
+            return True
+        home_page = self.run_query(self.adapter.home_query)
+        search_box = resolve_field(home_page, self.adapter.search_box)
+        search_box.fill(item)
+        # Readiness is checked on the current document, so wait until the results page has replaced the home page.
+        try:
+            with self.session.current_page.expect_navigation(wait_until="commit", timeout=self.ready_budget * 1000):
+                search_box.press("Enter")
+        except PlaywrightTimeoutError:
+            logger.warning("Search box at %s did not navigate to results", self.url)
+        return False
+
+    @traced("extract_results")
+    def extract_results(self):
+        """
+        Extracts the products on the current results page with the site's
+        extraction strategy. Returns an empty list if there are none.
+        """
+        strategy = self.adapter.extraction
+        if strategy == "api" and self.api_endpoints is None:
+            strategy = "selector_cache"
+        if strategy == "selector_cache" and self.selector_cache is None:
+            strategy = "agentql"
+        return getattr(self, f"extract_{strategy}")()
+
+    def query_search(self):
+        """
+        Runs the site's search query. Returns the products and the raw AgentQL response.
+        """
+        search_results = self.run_query(self.adapter.search_query)
+        if not resolve_field(search_results, self.adapter.products):
+            return [], search_results
+        return self.adapter.products_of(search_results.to_data()), search_results
+
+    def extract_agentql(self):
+        return self.query_search()[0]
+
+    def extract_selector_cache(self):
+        """
+        Extracts with cached selectors while they still match, otherwise with
+        the search query, learning selectors from its answer.
+        """
+        page = self.session.current_page
+        cached = self.selector_cache.extract(page, page.url)
+        if cached is not None:
+            return cached
+        products, search_results = self.query_search()
+        if products:
+            try:
+                self.selector_cache.learn(page, page.url, resolve_field(search_results, self.adapter.products))
+            except Exception as e:
+                logger.warning("Could not learn selectors at %s: %s", page.url, e)
+        return products
+
+    def start_capture(self, item):
+        """
+        Starts collecting the JSON responses the page fetches, for extract_api.
+        """
+        if self.api_endpoints is None:
+            return
+        self.captured = []
+        self.capture_item = item
+        if not self._capturing:
+            self.session.current_page.on("response", self.on_response)
+            self._capturing = True
+
+    def on_response(self, response):
+        # Bodies are read later by extract_api; Playwright's sync API can't be called from event handlers.
+        if (response.request.resource_type in ("xhr", "fetch")
+                and "json" in response.headers.get("content-type", "")):
+            self.captured.append(response)
+
+    def extract_api(self):
+        """
+        Maps the products out of the search API responses captured while the
+        results page loaded, learning the endpoint for direct calls. Falls back
+        to the DOM when no response has products.
+        """
+        for response in reversed(self.captured):
+            try:
+                payload = response.json()
+            except Exception:
+                continue
+            found = find_products(payload, self.capture_item)
+            if found is None:
+                continue
+            path, fields = found
+            self.api_endpoints.learn(self.url, response.url, response.request.method, response.request.headers,
+                                     path, fields, self.capture_item)
+            logger.debug("Extracted products at %s from %s", self.url, response.url)
+            return map_products(payload, path, fields, self.url)
+        logger.debug("No search API response captured at %s, reading the page", self.url)
+        return self.extract_selector_cache() if self.selector_cache is not None else self.extract_agentql()
+
+    @traced("search_api")
+    def search_api(self, item):
+        """
+        Calls the site's learned search endpoint for item without rendering the
+        page. Returns None when there is no endpoint or it no longer answers
+        with products, so the caller renders the results page instead.
+        """
+        endpoint, headers = self.api_endpoints.lookup(self.url)
+        if endpoint is None or not api_client.available:
+            return None
+        request_url = endpoint_url(endpoint, item)
+        start = time.perf_counter()
+        try:
+            cookies = self.session.current_page.context.cookies(request_url)
+            self.last_status, payload = api_client.get_json(request_url, headers, cookies)
+        except Exception as e:
+            self.record_response(start)
+            logger.warning("Search API call failed at %s: %s", self.url, e)
+            return None
+        self.record_response(start)
+        if is_throttled(self.last_status):
+            raise RetryableStatusError(request_url, self.last_status)
+        products = map_products(payload, endpoint["products"], endpoint["fields"], self.url) if payload else None
+        if products is None:
+            logger.warning("Search API at %s answered %s without products, reading the page", self.url, self.last_status)
+            self.api_endpoints.invalidate(self.url)
+            return None
+        return self.adapter.matching_products(products, item) or None
+
+    @traced("search_item")
+    def search_item(self, item):
+        """
+        Searches for item once and returns its products, from the site's search
+        API when one has been learned, otherwise from the results page and the
+        pages after it. Retrying is left to the caller's rate limiter, so
+        retries never multiply across layers.
+        """
+        if self.api_endpoints is not None:
+            products = self.search_api(item)
+            if products:
+                return {"results": {"products": products}}
+        direct = self.open_results(item)
+        waited = self.wait_until_ready()
+        self.load_more()
+        products = self.adapter.matching_products(self.extract_results(), item)
+        if not products and direct:
+            logger.warning("Search URL gave no products for %s at %s. Falling back to the search box.", item, self.url)
+            self.open_results(item, direct=False)
+            waited += self.wait_until_ready()
+            self.load_more()
+            products = self.adapter.matching_products(self.extract_results(), item)
+            direct = False
+        if not products:
+            raise ValueError(f"No products found for {item} at {self.url}.")
+        logger.info("Waited %.2fs for %s results at %s", waited, item, self.url)
+        if direct:
+            products += self.later_pages(item, products)
+        return {"results": {"products": products}}
+
+    def later_pages(self, item, products):
+        """
+        Follows the site's page URLs for item from page 2, until the page budget
+        is spent or a page adds no new matching products. Returns the new products.
+        """
+        seen = set()
+        new_products(products, seen)
+        found = []
+        for page in range(2, self.adapter.pagination["max_pages"] + 1):
+            page_url = self.adapter.page_url_for(self.url, item, page)
+            if page_url is None:
+                break
+            try:
+                page_products = new_products(self.result_page(page_url, item), seen)
+            except Exception as e:
+                logger.warning("Stopped paging %s at %s on page %s: %s", item, self.url, page, e)
+                break
+            if not page_products:
+                break
+            found.extend(page_products)
+        if found:
+            logger.info("Pagination added %d products for %s at %s", len(found), item, self.url)
+        return found
+
+    @traced("result_page")
+    def result_page(self, page_url, item):
+        """
+        Loads one further results page under the domain's rate limit and returns
+        its products matching item.
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait(self.url)
+        self.last_status = None
+        self.start_capture(item)
+        self.navigate(page_url)
+        self.wait_until_ready()
+        self.load_more()
+        return self.adapter.matching_products(self.extract_results(), item)
 
+    @traced("category_page")
+    def category_page(self, page):
+        """
+        Opens page (1-based) of the site's category listing and returns all of
+        its products, unfiltered, for fan_out to match against the items.
+        """
+        self.last_status = None
+        self.start_capture(None)
+        self.navigate(self.adapter.category_url_for(self.url, page))
+        self.wait_until_ready()
+        self.load_more()
+        return self.extract_results()
@@ -1,70 +1,299 @@
 import asyncio
 import logging
+import time
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from readiness import wait_until_ready_async, scroll_until_loaded_async
+from rate_limiter import RetryableStatusError, is_throttled
+from session_store import changed_cookies
+from site_adapters import adapter_for, resolve_field, action_value, new_products
+from api_extraction import api_client, find_products, map_products, endpoint_url
+from tracing import tracer, traced
 
-LOCATE_QUERY = """
-{
-    cep_btn
-    cep_box
-}
-"""
-
-HOME_QUERY = """
-{
-    header {
-        search_box
-    }
-}
-"""
-
-SEARCH_QUERY = """
-{
-    results {
-        products[] {
-            product_description
-            product_price
-            product_discount_price
-        }
-    }
-}
-"""
+logger = logging.getLogger(__name__)
 
 class SiteLogicAsync:
-    def __init__(self, session, url):
+    def __init__(self, session, url, adapter=None, ready_selector=None, ready_budget=None, selector_cache=None,
+                 rate_limiter=None, api_endpoints=None):
         self.session = session
         self.url = url
+        self.adapter = adapter or adapter_for(url)
+        self.selector_cache = selector_cache if self.adapter.extraction in ("selector_cache", "api") else None
+        self.api_endpoints = api_endpoints if self.adapter.extraction == "api" else None
+        self.captured = []
+        self.capture_item = None
+        self._capturing = False
+        if ready_selector is None and self.selector_cache is not None:
+            ready_selector = self.selector_cache.products_selector(url)
+        self.ready_selector = ready_selector
+        self.ready_budget = ready_budget or self.adapter.ready_budget
+        self.rate_limiter = rate_limiter
+        self.last_status = None
 
+    @traced("wait_until_ready")
+    async def wait_until_ready(self, budget=None):
+        return await wait_until_ready_async(self.session.current_page, self.url, self.ready_selector,
+                                            budget or self.ready_budget)
+
+    @traced("load_more")
+    async def load_more(self):
+        steps = self.adapter.pagination["scroll_steps"]
+        return await scroll_until_loaded_async(self.session.current_page, steps) if steps else 0
+
+    @traced("set_postal_code")
     async def set_postal_code(self):
-        self.log_query("LOCATE_QUERY")
-        if self.url == "https://mercado.carrefour.com.br/":
-            cep_set = await self.session.query(LOCATE_QUERY)
-            await cep_set.cep_btn.click(force=True)
-            cep_data = await self.session.query(LOCATE_QUERY)
-            await cep_data.cep_box.fill("71218-010")
-            await cep_data.cep_btn.click(force=True)
+        for step in self.adapter.setup:
+            response = await self.run_query(step["query"])
+            for action in step["actions"]:
+                if "fill" in action:
+                    await resolve_field(response, action["fill"]).fill(action_value(action["value"]))
+                if "press" in action:
+                    await resolve_field(response, action["press"]).press(action["key"])
+                if "click" in action:
+                    await resolve_field(response, action["click"]).click(force=action.get("force", False))
+        if not self.adapter.setup:
+            return False
+        await self.wait_until_ready()
+        return True
+
+    async def setup(self, session_store):
+        context = self.session.current_page.context
+        before = await context.cookies()
+        if await self.set_postal_code():
+            session_store.save(self.url, await context.storage_state(),
+                               changed_cookies(before, await context.cookies()))
 
     def log_query(self, query_name):
-        logging.debug(f"querying - {query_name}")
-
-    async def search_item(self, item, max_retries=3):
-        self.log_query("HOME_QUERY")
-        home_page = await self.session.query(HOME_QUERY)
-        await home_page.header.search_box.fill(item)
-        await home_page.header.search_box.press("Enter")
-        await asyncio.sleep(2)  # Increase wait time to ensure page load
-        
-        retries = 0
-        while retries < max_retries:
-            self.log_query("SEARCH_QUERY")
-            search_results = await self.session.query(SEARCH_QUERY)
-            if search_results.results.products:
-                filtered_products = [
-                    product for product in search_results.results.products 
-                    if item.lower() in product.get("product_description", "").lower()
-                ]
-                if filtered_products:
-                    return {"results": {"products": filtered_products}}
-            retries += 1
-            logging.warning(f"No products found for {item} at {self.url}. Retrying {retries}/{max_retries}.")
-            await asyncio.sleep(2)  # Wait before retrying
-
-        raise ValueError(f"No products found for {item} at {self.url} after {max_retries} retries.")
+        logger.debug("querying - %s", query_name)
+
+    async def run_query(self, query_name):
+        self.log_query(query_name)
+        with tracer.span("agentql.query", query=query_name):
+            return await self.session.query(self.adapter.query(query_name))
+
+    async def navigate(self, page_url):
+        logger.debug("Navigating directly to %s", page_url)
+        start = time.perf_counter()
+        try:
+            response = await self.session.current_page.goto(page_url)
+        except Exception:
+            self.record_response(start)
+            raise
+        self.last_status = response.status if response is not None else None
+        self.record_response(start)
+        if is_throttled(self.last_status):
+            raise RetryableStatusError(page_url, self.last_status)
+
+    def record_response(self, start):
+        """
+        Feeds the time since start and the last status to the domain's rate
+        limiter, so it adapts to server responses rather than to extraction.
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.record(self.url, time.perf_counter() - start, self.last_status)
+
+    @traced("open_results")
+    async def open_results(self, item, direct=True):
+        search_url = self.adapter.search_url_for(self.url, item) if direct else None
+        self.last_status = None
+        self.start_capture(item)
+        if search_url:
+            await self.navigate(search_url)
+            return True
+        if self.session.current_page.url == "about:blank":
+            await self.session.current_page.goto(self.url)
+        home_page = await self.run_query(self.adapter.home_query)
+        search_box = resolve_field(home_page, self.adapter.search_box)
+        await search_box.fill(item)
+        try:
+            async with self.session.current_page.expect_navigation(wait_until="commit", timeout=self.ready_budget * 1000):
+                await search_box.press("Enter")
+        except PlaywrightTimeoutError:
+            logger.warning("Search box at %s did not navigate to results", self.url)
+        return False
+
+    @traced("extract_results")
+    async def extract_results(self):
+        strategy = self.adapter.extraction
+        if strategy == "api" and self.api_endpoints is None:
+            strategy = "selector_cache"
+        if strategy == "selector_cache" and self.selector_cache is None:
+            strategy = "agentql"
+        return await getattr(self, f"extract_{strategy}")()
+
+    async def query_search(self):
+        search_results = await self.run_query(self.adapter.search_query)
+        if not resolve_field(search_results, self.adapter.products):
+            return [], search_results
+        return self.adapter.products_of(await search_results.to_data()), search_results
+
+    async def extract_agentql(self):
+        return (await self.query_search())[0]
+
+    async def extract_selector_cache(self):
+        page = self.session.current_page
+        cached = await self.selector_cache.extract_async(page, page.url)
+        if cached is not None:
+            return cached
+        products, search_results = await self.query_search()
+        if products:
+            try:
+                await self.selector_cache.learn_async(page, page.url, resolve_field(search_results, self.adapter.products))
+            except Exception as e:
+                logger.warning("Could not learn selectors at %s: %s", page.url, e)
+        return products
+
+    def start_capture(self, item):
+        if self.api_endpoints is None:
+            return
+        self.captured = []
+        self.capture_item = item
+        if not self._capturing:
+            self.session.current_page.on("response", self.on_response)
+            self._capturing = True
+
+    def on_response(self, response):
+        if (response.request.resource_type in ("xhr", "fetch")
+                and "json" in response.headers.get("content-type", "")):
+            self.captured.append(response)
+
+    async def extract_api(self):
+        for response in reversed(self.captured):
+            try:
+                payload = await response.json()
+            except Exception:
+                continue
+            found = find_products(payload, self.capture_item)
+            if found is None:
+                continue
+            path, fields = found
+            self.api_endpoints.learn(self.url, response.url, response.request.method, response.request.headers,
+                                     path, fields, self.capture_item)
+            logger.debug("Extracted products at %s from %s", self.url, response.url)
+            return map_products(payload, path, fields, self.url)
+        logger.debug("No search API response captured at %s, reading the page", self.url)
+        if self.selector_cache is not None:
+            return await self.extract_selector_cache()
+        return await self.extract_agentql()
+
+    @traced("search_api")
+    async def search_api(self, item):
+        endpoint, headers = self.api_endpoints.lookup(self.url)
+        if endpoint is None or not api_client.available:
+            return None
+        request_url = endpoint_url(endpoint, item)
+        start = time.perf_counter()
+        try:
+            cookies = await self.session.current_page.context.cookies(request_url)
+            self.last_status, payload = await api_client.get_json_async(request_url, headers, cookies)
+        except Exception as e:
+            self.record_response(start)
+            logger.warning("Search API call failed at %s: %s", self.url, e)
+            return None
+        self.record_response(start)
+        if is_throttled(self.last_status):
+            raise RetryableStatusError(request_url, self.last_status)
+        products = map_products(payload, endpoint["products"], endpoint["fields"], self.url) if payload else None
+        if products is None:
+            logger.warning("Search API at %s answered %s without products, reading the page", self.url, self.last_status)
+            self.api_endpoints.invalidate(self.url)
+            return None
+        return self.adapter.matching_products(products, item) or None
+
+    @traced("search_item")
+    async def search_item(self, item):
+        """
+        Searches for item once and returns its products, from the site's search
+        API when one has been learned, otherwise from the results page and the
+        pages after it. Retrying is left to the caller's rate limiter, so
+        retries never multiply across layers.
+        """
+        if self.api_endpoints is not None:
+            products = await self.search_api(item)
+            if products:
+                return {"results": {"products": products}}
+        direct = await self.open_results(item)
+        waited = await self.wait_until_ready()
+        await self.load_more()
+        products = self.adapter.matching_products(await self.extract_results(), item)
+        if not products and direct:
+            logger.warning("Search URL gave no products for %s at %s. Falling back to the search box.", item, self.url)
+            await self.open_results(item, direct=False)
+            waited += await self.wait_until_ready()
+            await self.load_more()
+            products = self.adapter.matching_products(await self.extract_results(), item)
+            direct = False
+        if not products:
+            raise ValueError(f"No products found for {item} at {self.url}.")
+        logger.info("Waited %.2fs for %s results at %s", waited, item, self.url)
+        if direct:
+            products += await self.later_pages(item, products)
+        return {"results": {"products": products}}
+
+    async def later_pages(self, item, products):
+        """
+        Follows the site's page URLs for item from page 2, fetching parallel_pages
+        of them at a time on sibling tabs. Pages are taken in order until the page
+        budget is spent or a page adds no new matching products; the rest of
+        that batch is dropped. Returns the new products.
+        """
+        pagination = self.adapter.pagination
+        seen = set()
+        new_products(products, seen)
+        found = []
+        pages = list(range(2, pagination["max_pages"] + 1))
+        if self.adapter.page_url_for(self.url, item, 2) is None:
+            pages = []
+        exhausted = False
+        for offset in range(0, len(pages), pagination["parallel_pages"]):
+            if exhausted:
+                break
+            batch = pages[offset:offset + pagination["parallel_pages"]]
+            results = await asyncio.gather(
+                *(self.sibling_page(self.adapter.page_url_for(self.url, item, page), item) for page in batch),
+                return_exceptions=True)
+            for page, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    logger.warning("Stopped paging %s at %s on page %s: %s", item, self.url, page, result)
+                    exhausted = True
+                    break
+                page_products = new_products(result, seen)
+                if not page_products:
+                    exhausted = True
+                    break
+                found.extend(page_products)
+        if found:
+            logger.info("Pagination added %d products for %s at %s", len(found), item, self.url)
+        return found
+
+    async def sibling_page(self, page_url, item):
+        """
+        Loads page_url on a new tab of this session's context and returns its
+        products matching item.
+        """
+        session = await self.session.sibling()
+        try:
+            sibling = SiteLogicAsync(session, self.url, self.adapter, self.ready_selector, self.ready_budget,
+                                     self.selector_cache, self.rate_limiter, self.api_endpoints)
+            return await sibling.result_page(page_url, item)
+        finally:
+            await session.stop()
+
+    @traced("result_page")
+    async def result_page(self, page_url, item):
+        if self.rate_limiter is not None:
+            await self.rate_limiter.wait_async(self.url)
+        self.last_status = None
+        self.start_capture(item)
+        await self.navigate(page_url)
+        await self.wait_until_ready()
+        await self.load_more()
+        return self.adapter.matching_products(await self.extract_results(), item)
+
+    @traced("category_page")
+    async def category_page(self, page):
+        self.last_status = None
+        self.start_capture(None)
+        await self.navigate(self.adapter.category_url_for(self.url, page))
+        await self.wait_until_ready()
+        await self.load_more()
+        return await self.extract_results()
@@ -0,0 +1,96 @@
+import csv
+import heapq
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+OFFER_FIELDS = ["item", "volume", "package_type", "url", "product_description", "unit_price", "price_per_liter"]
+
+class TopOffers:
+    """
+    The k cheapest offers by price per liter for each (item, volume, package
+    type), kept in bounded heaps while rows stream past. Offers are copies of
+    the offer fields, so the rows themselves are never held or modified. A
+    product listed more than once by the same store counts once, at its
+    cheapest.
+    """
+    def __init__(self, k=5):
+        self.k = k
+        self._heaps = {}
+        # Breaks price ties in arrival order, so results are stable.
+        self._sequence = itertools.count()
+
+    def update(self, row):
+        price_per_liter = row.get('price_per_liter')
+        if price_per_liter is None or price_per_liter == '':
+            return
+        key = (row['item'], row.get('volume'), row.get('package_type'))
+        # Max-heap on price via negation: the root is the most expensive kept offer.
+        entry = (-price_per_liter, -next(self._sequence), {name: row.get(name) for name in OFFER_FIELDS})
+        heap = self._heaps.setdefault(key, [])
+        # k is small, so a linear scan for the same store and product is cheap.
+        for index, kept in enumerate(heap):
+            if kept[2]['url'] == row['url'] and kept[2]['product_description'] == row['product_description']:
+                if entry > kept:
+                    heap[index] = entry
+                    heapq.heapify(heap)
+                return
+        if len(heap) < self.k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    def track(self, rows):
+        """
+        Updates the heaps from rows as they pass through, yielding each one on.
+        """
+        for row in rows:
+            self.update(row)
+            yield row
+
+    def merge(self, offers):
+        """
+        Adds the offers of another result(), e.g. from a chunk processed elsewhere.
+        """
+        for group in offers.values():
+            for offer in group:
+                self.update(offer)
+
+    def result(self):
+        """
+        Returns {(item, volume, package_type): [offers, cheapest first]}.
+        """
+        return {
+            key: [offer for _, _, offer in sorted(heap, reverse=True)]
+            for key, heap in sorted(self._heaps.items(), key=lambda entry: tuple(str(part) for part in entry[0]))
+        }
+
+def top_offers_per_type(data, k=5):
+    """
+    Returns the k cheapest offers per item, volume and package type in data.
+    """
+    top_offers = TopOffers(k)
+    for row in data:
+        top_offers.update(row)
+    return top_offers.result()
+
+def write_top_offers(output_file, offers):
+    """
+    Writes the offers as a CSV report with each offer's rank within its group.
+    """
+    with open(output_file, mode='w', newline='', encoding='utf-8') as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=["rank"] + OFFER_FIELDS)
+        writer.writeheader()
+        for group in offers.values():
+            for rank, offer in enumerate(group, start=1):
+                writer.writerow({"rank": rank, **offer})
+    logger.info("Wrote top offers for %d product types to %s", len(offers), output_file)
+    return output_file
+
+def print_top_offers(offers):
+    for (item, volume, package), group in offers.items():
+        print(f"Cheapest {item} {volume or '?'} {package or ''}".rstrip() + ":")
+        for rank, offer in enumerate(group, start=1):
+            print(f"  {rank}. R${offer['price_per_liter']:.2f}/l - R${offer['unit_price']:.2f} - "
+                  f"{offer['product_description']} ({offer['url']})")
@@ -0,0 +1,203 @@
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """
+    One timed stage of a crawl. Spans inherit the url and item of their parent,
+    so a query inside a search is counted against that (url, item) task.
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "task", "start_ns", "end_ns", "error")
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        parent_task = parent.task if parent else (None, None)
+        self.task = (attributes.get("url", parent_task[0]), attributes.get("item", parent_task[1]))
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+class StageStats:
+    __slots__ = ("count", "total", "max", "errors")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def add(self, duration, failed):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.errors += failed
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_s": round(self.total, 4),
+            "mean_s": round(self.total / self.count, 4) if self.count else 0.0,
+            "max_s": round(self.max, 4),
+            "errors": self.errors,
+        }
+
+class Tracer:
+    """
+    Records crawl stages as spans, aggregating durations and counts per stage
+    and per (url, item). Individual spans are kept only when recording for an
+    OpenTelemetry export.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._tasks = {}
+        self.spans = None
+
+    def record_spans(self, enabled=True):
+        with self._lock:
+            self.spans = [] if enabled else None
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            span.end_ns = span.start_ns + int(duration * 1e9)
+            _current_span.reset(token)
+            self._record(span, duration)
+
+    def stage_summary(self):
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in sorted(self._stages.items())}
+
+    def task_summary(self):
+        """
+        Returns [{url, item, total_s, stages}] for every (url, item) task, slowest first.
+        """
+        with self._lock:
+            tasks = [
+                {
+                    "url": url,
+                    "item": item,
+                    "total_s": round(stages["crawl_task"].total, 4) if "crawl_task" in stages else None,
+                    "stages": {name: stats.as_dict() for name, stats in sorted(stages.items())},
+                }
+                for (url, item), stages in self._tasks.items() if item is not None
+            ]
+        return sorted(tasks, key=lambda task: task["total_s"] or 0.0, reverse=True)
+
+    def log_summary(self, slowest=5):
+        for name, stats in self.stage_summary().items():
+            logger.info("Stage %s: %d calls, %.2fs total, %.3fs mean, %.2fs max, %d errors", name, stats["count"],
+                        stats["total_s"], stats["mean_s"], stats["max_s"], stats["errors"])
+        for task in self.task_summary()[:slowest]:
+            breakdown = ", ".join(f"{name} {stats['total_s']:.2f}s x{stats['count']}"
+                                  for name, stats in task["stages"].items() if name != "crawl_task")
+            logger.info("Slow task %s at %s: %.2fs (%s)", task["item"], task["url"], task["total_s"] or 0.0, breakdown)
+
+    def write_summary(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"stages": self.stage_summary(), "tasks": self.task_summary()}, file, indent=2)
+        logger.info("Wrote trace summary to %s", path)
+
+    def export_otlp(self, path, service_name="webbuyer"):
+        """
+        Writes the recorded spans as OTLP/JSON, the format OpenTelemetry
+        collectors and viewers import.
+        """
+        with self._lock:
+            spans = list(self.spans or [])
+        document = {"resourceSpans": [{
+            "resource": {"attributes": [otlp_attribute("service.name", service_name)]},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [otlp_span(span) for span in spans],
+            }],
+        }]}
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(document, file)
+        logger.info("Exported %d spans to %s", len(spans), path)
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._tasks.clear()
+            if self.spans is not None:
+                self.spans = []
+
+    def _record(self, span, duration):
+        failed = span.error is not None
+        with self._lock:
+            self._stages.setdefault(span.name, StageStats()).add(duration, failed)
+            if span.task != (None, None):
+                self._tasks.setdefault(span.task, {}).setdefault(span.name, StageStats()).add(duration, failed)
+            if self.spans is not None:
+                self.spans.append(span)
+
+def traced(name):
+    """
+    Decorates a function or coroutine function so each call is recorded as a span.
+    """
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+def otlp_span(span):
+    attributes = dict(span.attributes)
+    attributes.update({"url": span.task[0], "item": span.task[1]})
+    record = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [otlp_attribute(key, value) for key, value in attributes.items() if value is not None],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        record["parentSpanId"] = span.parent_id
+    return record
+
+tracer = Tracer()
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from data_handler import parse_description
+
+# (description, (volume, volume_value, package, quantity)) where the single-pass
+# parser gives what the old dictionary/substring parser gave.
+UNCHANGED = [
+    ("cerveja heineken lata 350ml", ("350ml", 350, "lata", 1)),
+    ("cerveja heineken garrafa 600ml", ("600ml", 600, "garrafa", 1)),
+    ("cerveja heineken long neck 330ml", ("330ml", 330, "garrafa", 1)),
+    ("cerveja stella ln 275ml", ("275ml", 275, "garrafa", 1)),
+    ("cerveja heineken barril 5l", ("5l", 5000, "barril", 1)),
+    ("cerveja keg 5 litros", ("5l", 5000, "barril", 1)),
+    ("cerveja heineken barril 5lt", ("5l", 5000, "barril", 1)),
+    ("cerveja sem alcool 0,0% lata 350ml", ("350ml", 350, "lata", 1)),
+    ("cerveja skol lata 350ml 12un", ("350ml", 350, "lata", 12)),
+    ("cerveja amstel 12 unidades 269ml", ("269ml", 269, None, 12)),
+]
+
+# Descriptions the old parser got wrong; its output is noted alongside.
+FIXED = [
+    # old: ("5l", 5000, None, 1), "5l" matched inside "1.5l"
+    ("cerveja brahma 1.5l", ("1.5l", 1500, None, 1)),
+    ("cerveja brahma 1,5l", ("1.5l", 1500, None, 1)),
+    # old: (None, None, None, 1), only the listed sizes were known
+    ("cerveja original 1 litro", ("1l", 1000, None, 1)),
+    ("cerveja petra 2 litros", ("2l", 2000, None, 1)),
+    # old: ("350ml", 350, "lata", 1), the count after "pack" was missed
+    ("cerveja budweiser pack 6 latas 350ml", ("350ml", 350, "lata", 6)),
+]
+
+@pytest.mark.parametrize("description, expected", UNCHANGED + FIXED)
+def test_parse_description(description, expected):
+    assert parse_description(description) == expected
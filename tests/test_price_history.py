@@ -0,0 +1,35 @@
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from price_history import PriceHistory, run_id_for
+
+def row(url, description, price_per_liter):
+    return {"url": url, "item": "heineken", "product_description": description,
+            "product_price": price_per_liter * 0.35, "product_discount_price": None,
+            "unit_price": price_per_liter * 0.35, "price_per_liter": price_per_liter}
+
+def test_older_run_recorded_after_newer_one(tmp_path):
+    history = PriceHistory(str(tmp_path / "history.sqlite3"))
+    newer, older = datetime(2024, 1, 2, 10, 0), datetime(2024, 1, 1, 10, 0)
+    history.record_snapshot([row("a", "cerveja heineken lata 350ml", 12.0),
+                             row("b", "cerveja heineken lata 350ml", 11.0)], newer)
+    history.record_snapshot([row("a", "cerveja heineken lata 350ml", 10.0),
+                             row("b", "cerveja heineken lata 350ml", 13.0)], older)
+    assert history.lowest_price_per_type(run_id_for(older))["heineken"]["price"] == 10.0
+    assert history.lowest_price_per_type(run_id_for(older))["heineken"]["product"]["url"] == "a"
+    assert history.lowest_price_per_type(run_id_for(newer))["heineken"]["product"]["url"] == "b"
+    history.close()
+
+def test_runs_in_the_same_minute_stay_apart(tmp_path):
+    history = PriceHistory(str(tmp_path / "history.sqlite3"))
+    first, second = datetime(2024, 1, 1, 10, 0, 5), datetime(2024, 1, 1, 10, 0, 40)
+    assert run_id_for(first) != run_id_for(second)
+    history.record_snapshot([row("a", "cerveja heineken lata 350ml", 12.0)], first)
+    history.record_snapshot([row("a", "cerveja heineken lata 350ml", 9.0)], second)
+    assert history.lowest_price_per_type(run_id_for(first))["heineken"]["price"] == 12.0
+    assert history.lowest_price_per_type(run_id_for(second))["heineken"]["price"] == 9.0
+    assert len(history.changes_since_last_run(run_id_for(second))) == 1
+    history.close()
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from site_adapters import registry
+
+PRODUCTS = [
+    {"product_description": "Cerveja Beck's Puro Malte Long Neck 330ml"},
+    {"product_description": "CERVEJA BECK’S LATA 350ML"},
+    {"product_description": "Cerveja Eisenbahn Pilsen Lata 350ml"},
+    {"product_description": "Cerveja Antárctica Original 600ml"},
+]
+
+@pytest.mark.parametrize("item, expected", [
+    ("Becks", [0, 1]),
+    ("Beck's", [0, 1]),
+    ("eisenbahn", [2]),
+    ("Antarctica", [3]),
+    ("Heineken", []),
+])
+def test_matching_products_ignores_case_accents_and_apostrophes(item, expected):
+    adapter = registry.fallback
+    assert adapter.filter_by_item
+    assert adapter.matching_products(PRODUCTS, item) == [PRODUCTS[i] for i in expected]